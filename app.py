@@ -1,13 +1,41 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, make_response
+from werkzeug.exceptions import HTTPException
 import os
 import json
-import requests
+import sys
 from datetime import datetime
 import hashlib
-from github import Github
 import time
 import threading
 import base64
+import re
+import gzip
+import tempfile
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import contextvars
+import functools
+import itertools
+import hmac
+import tracemalloc
+import socket
+import sqlite3
+from contextlib import closing, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
@@ -16,17 +44,1461 @@ AIPIPE_API_KEY = os.environ.get('AIPIPE_API_KEY')
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')
 SECRET_KEY = os.environ.get('SECRET_KEY')
 
-# Initialize clients only if keys are provided
-github_client = None
+# Structured logging: records are queued and written as JSON by a background thread
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
+LOG_MAX_PAYLOAD = int(os.environ.get('LOG_MAX_PAYLOAD', '2000'))
+LOG_SPILL_DIR = os.environ.get('LOG_SPILL_DIR')
+LOG_SPILL_MAX_FILES = int(os.environ.get('LOG_SPILL_MAX_FILES', '100'))
+
+_log_context = threading.local()
+
+def set_log_context(project_id=None, stage=None):
+    """Attach a project_id and build stage to log records from the current thread"""
+    _log_context.project_id = project_id
+    _log_context.stage = stage
+
+def set_log_stage(stage):
+    """Update the build stage for the current thread"""
+    _log_context.stage = stage
+
+class LogContextFilter(logging.Filter):
+    """Copy the thread's log context onto each record"""
+
+    def filter(self, record):
+        record.project_id = getattr(_log_context, 'project_id', None)
+        record.stage = getattr(_log_context, 'stage', None)
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line.
+
+    Large payloads passed via ``extra={'payload': ...}`` are truncated to
+    LOG_MAX_PAYLOAD characters; if LOG_SPILL_DIR is set the full payload is
+    written to a file there, keeping at most LOG_SPILL_MAX_FILES files.
+    """
+
+    def __init__(self, max_payload, spill_dir=None, spill_max_files=100):
+        super().__init__()
+        self.max_payload = max_payload
+        self.spill_dir = spill_dir
+        self.spill_max_files = spill_max_files
+        self._counter = itertools.count()
+
+    def _spill(self, record, payload):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        # pid and a counter keep names unique across workers and within one millisecond
+        name = f"{record.project_id or 'none'}-{record.stage or 'none'}-{int(record.created * 1000)}-{os.getpid()}-{next(self._counter)}.txt"
+        path = os.path.join(self.spill_dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        self._prune_spilled()
+        return path
+
+    def _prune_spilled(self):
+        # Scan the directory so the cap covers files written by every worker
+        spilled = []
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.endswith('.txt'):
+                try:
+                    spilled.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        spilled.sort()
+        for _, path in spilled[:max(0, len(spilled) - self.spill_max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'project_id': getattr(record, 'project_id', None),
+            'stage': getattr(record, 'stage', None),
+            'thread': record.threadName
+        }
+
+        payload = getattr(record, 'payload', None)
+        if payload is not None:
+            payload = str(payload)
+            entry['payload_size'] = len(payload)
+            if len(payload) > self.max_payload:
+                entry['payload'] = payload[:self.max_payload]
+                entry['payload_truncated'] = True
+                if self.spill_dir:
+                    try:
+                        entry['payload_file'] = self._spill(record, payload)
+                    except OSError as e:
+                        entry['payload_spill_error'] = str(e)
+            else:
+                entry['payload'] = payload
+
+        return json.dumps(entry)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue, target):
+        super().__init__(log_queue)
+        self.target = target
+        self.dropped = 0
+        self._listener = None
+        self._listener_pid = None
+
+    def _ensure_listener(self):
+        # The writer thread is started lazily so forked workers get their own
+        if self._listener_pid == os.getpid():
+            return
+        self._listener_pid = os.getpid()
+        self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+        self._listener.start()
+        atexit.register(self._listener.stop)
+
+    def prepare(self, record):
+        # Leave the payload untouched; truncation happens on the writer thread
+        payload = getattr(record, 'payload', None)
+        record = super().prepare(record)
+        if payload is not None:
+            record.payload = payload
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            note = logging.LogRecord(record.name, logging.WARNING, __file__, 0, f"Dropped {dropped} log records (queue full)", None, None)
+            note.project_id = note.stage = None
+            try:
+                self.queue.put_nowait(note)
+            except queue.Full:
+                self.dropped += dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def create_logger():
+    """Build the application logger with a non-blocking JSON handler"""
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter(LOG_MAX_PAYLOAD, LOG_SPILL_DIR, LOG_SPILL_MAX_FILES))
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE), stream_handler)
+    queue_handler.addFilter(LogContextFilter())
+
+    new_logger = logging.getLogger('llm_app_builder')
+    new_logger.setLevel(LOG_LEVEL)
+    new_logger.addHandler(queue_handler)
+    new_logger.propagate = False
+    return new_logger
+
+logger = create_logger()
+
+# Tracing: OpenTelemetry-style spans per build, exported to a file or a local OTLP collector
+TRACE_EXPORT = os.environ.get('TRACE_EXPORT', 'none')  # 'none', 'file' or 'otlp'
+TRACE_FILE = os.environ.get('TRACE_FILE', 'traces.jsonl')
+OTLP_ENDPOINT = os.environ.get('OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.1'))
+TRACE_QUEUE_SIZE = int(os.environ.get('TRACE_QUEUE_SIZE', '10000'))
+TRACE_BATCH_SIZE = int(os.environ.get('TRACE_BATCH_SIZE', '256'))
+TRACE_FLUSH_INTERVAL = float(os.environ.get('TRACE_FLUSH_INTERVAL', '5'))
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """A timed operation within a trace. Unsampled spans record nothing."""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'sampled', 'attributes', 'start_ns', 'end_ns', 'error')
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        if parent is None:
+            self.trace_id = os.urandom(16).hex()
+            self.parent_id = None
+            self.sampled = TRACE_EXPORT != 'none' and random.random() < TRACE_SAMPLE_RATE
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.sampled = parent.sampled
+        self.attributes = dict(attributes or {}) if self.sampled else {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def to_otlp(self):
+        attributes = []
+        for key, value in self.attributes.items():
+            if isinstance(value, bool):
+                typed = {'boolValue': value}
+            elif isinstance(value, int):
+                typed = {'intValue': str(value)}
+            elif isinstance(value, float):
+                typed = {'doubleValue': value}
+            else:
+                typed = {'stringValue': str(value)}
+            attributes.append({'key': key, 'value': typed})
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': attributes,
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1}
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+class SpanExporter:
+    """Batches finished spans on a background thread and writes them out"""
+
+    def __init__(self, mode, path, endpoint, queue_size, batch_size, flush_interval):
+        self.mode = mode
+        self.path = path
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._thread_pid = None
+
+    def export(self, span):
+        if self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._run, name="span-exporter", daemon=True).start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write([span.to_otlp() for span in batch])
+                except Exception as e:
+                    logger.warning(f"Span export failed: {str(e)}")
+
+    def _write(self, spans):
+        if self.mode == 'file':
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for span in spans:
+                    f.write(json.dumps(span) + '\n')
+        elif self.mode == 'otlp':
+            body = {
+                'resourceSpans': [{
+                    'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'llm-app-builder'}}]},
+                    'scopeSpans': [{'scope': {'name': 'llm_app_builder'}, 'spans': spans}]
+                }]
+            }
+            get_http_session().post(self.endpoint, json=body, timeout=10)
+
+span_exporter = SpanExporter(TRACE_EXPORT, TRACE_FILE, OTLP_ENDPOINT, TRACE_QUEUE_SIZE, TRACE_BATCH_SIZE, TRACE_FLUSH_INTERVAL)
+
+@contextmanager
+def start_span(name, **attributes):
+    """Run a block as a child of the current span (or as a new trace root)"""
+    span = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        if span.sampled:
+            span.end_ns = time.time_ns()
+            span_exporter.export(span)
+
+def traced(name):
+    """Decorator that wraps every call of a function in a span"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def current_span():
+    return _current_span.get()
 
 # aipipe.org API configuration
 AIPIPE_API_URL = "https://aipipe.org/openrouter/v1/chat/completions"
 
-if GITHUB_TOKEN:
-    github_client = Github(GITHUB_TOKEN)
+# Clients are created on first use so workers boot without importing PyGithub or requests
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '20'))
+STARTUP_TARGET_MS = int(os.environ.get('STARTUP_TARGET_MS', '200'))
+
+github_client = None
+http_session = None
+_client_lock = threading.Lock()
+
+def get_github_client():
+    """Return the shared PyGithub client, creating it on first use"""
+    global github_client
+    if github_client is None and GITHUB_TOKEN:
+        with _client_lock:
+            if github_client is None:
+                from github import Github
+                github_client = Github(GITHUB_TOKEN)
+    return github_client
+
+def get_http_session():
+    """Return the shared pooled HTTP session used for aipipe.org and GitHub REST calls"""
+    global http_session
+    if http_session is None:
+        with _client_lock:
+            if http_session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                http_session = session
+    return http_session
+
+def http_request(method, url, retry_count=0, **kwargs):
+    """Make an HTTP call on the shared session inside a child span"""
+    with start_span(f"HTTP {method}", **{'http.method': method, 'http.url': url, 'http.retry_count': retry_count}) as span:
+        if span.sampled and 'json' in kwargs:
+            span.set_attribute('http.request_size', len(json.dumps(kwargs['json'])))
+        response = get_http_session().request(method, url, **kwargs)
+        span.set_attribute('http.status_code', response.status_code)
+        span.set_attribute('http.response_size', len(response.content))
+        return response
+
+def reset_clients_after_fork():
+    """Drop clients inherited from a parent process so each worker opens its own connections"""
+    global github_client, http_session, _client_lock
+    _client_lock = threading.Lock()
+    github_client = None
+    http_session = None
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_clients_after_fork)
+
+class ProjectStore(dict):
+    """Project records plus a version counter per project, used for status ETags.
+
+    Replacing or removing a record bumps its version automatically; code that
+    mutates a record in place must call touch().
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.versions = {}
+        self._version_lock = threading.Lock()
+
+    def touch(self, project_id):
+        with self._version_lock:
+            self.versions[project_id] = self.versions.get(project_id, 0) + 1
+
+    def __setitem__(self, project_id, record):
+        super().__setitem__(project_id, record)
+        self.touch(project_id)
+
+    def __delitem__(self, project_id):
+        super().__delitem__(project_id)
+        self.touch(project_id)
+
+    def pop(self, project_id, *default):
+        record = super().pop(project_id, *default)
+        self.touch(project_id)
+        return record
+
+    def version(self, project_id):
+        return self.versions.get(project_id, 0)
 
 # In-memory project storage (use database in production)
-projects_db = {}
+projects_db = ProjectStore()
+
+# Durable state (job checkpoints and the blobs they reference) lives under DATA_DIR
+DATA_DIR = os.environ.get('DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+# Generated artifacts live in a content-addressed blob store; only hot projects stay in memory
+BLOB_STORE_DIR = os.environ.get('BLOB_STORE_DIR', os.path.join(DATA_DIR, 'blobs'))
+CODE_CACHE_SIZE = int(os.environ.get('CODE_CACHE_SIZE', '32'))
+BLOB_RETENTION_DAYS = float(os.environ.get('BLOB_RETENTION_DAYS', '30'))
+
+class BlobStore:
+    """Content-addressed, compressed storage for generated artifacts.
+
+    Blobs are keyed by the SHA-256 of their uncompressed content, so identical
+    README and license bodies are written once and shared across projects.
+    Writing or reading a blob refreshes its mtime; collect_garbage() removes
+    blobs that have not been used within the retention period and are not
+    referenced by a stored job.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, content):
+        """Store content (str or bytes) and return its digest"""
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            self._touch(path)
+            return digest
+
+        if zstandard:
+            blob = b'Z' + zstandard.ZstdCompressor(level=10).compress(data)
+        else:
+            blob = b'G' + gzip.compress(data, compresslevel=6)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        return digest
+
+    def exists(self, digest):
+        return os.path.exists(self._path(digest))
+
+    def get(self, digest):
+        """Load and decompress a blob as text"""
+        path = self._path(digest)
+        with open(path, 'rb') as f:
+            blob = f.read()
+        self._touch(path)
+
+        codec, payload = blob[:1], blob[1:]
+        if codec == b'Z':
+            if not zstandard:
+                raise Exception(f"Blob {digest} is zstd-compressed but zstandard is not installed")
+            data = zstandard.ZstdDecompressor().decompress(payload)
+        else:
+            data = gzip.decompress(payload)
+        return data.decode('utf-8')
+
+    @staticmethod
+    def _touch(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def collect_garbage(self, max_age_seconds, keep=()):
+        """Delete blobs (and leftover temp files) unused for longer than max_age_seconds, except digests in keep"""
+        if not os.path.isdir(self.root):
+            return 0
+        cutoff = time.time() - max_age_seconds
+        removed = 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name in keep:
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
+
+class LRUCache:
+    """Small thread-safe LRU cache"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+blob_store = BlobStore(BLOB_STORE_DIR)
+code_cache = LRUCache(CODE_CACHE_SIZE)
+
+def store_project_code(project_id, code_data):
+    """Move generated code into the blob store and return the per-file digests"""
+    code_refs = {}
+    for key, value in code_data.items():
+        if not isinstance(value, str):
+            value = json.dumps(value)
+        code_refs[key] = blob_store.put(value)
+
+    code_cache.put(project_id, code_data)
+    return code_refs
+
+def load_project_code(project_id):
+    """Return a project's generated code, loading it from the blob store if it is not hot"""
+    code_data = code_cache.get(project_id)
+    if code_data is not None:
+        return code_data
+
+    project = projects_db.get(project_id) or {}
+    code_refs = project.get('code_refs')
+    if not code_refs:
+        return {}
+
+    code_data = load_code_refs(code_refs)
+    code_cache.put(project_id, code_data)
+    return code_data
+
+def load_code_refs(code_refs):
+    """Load generated code from the blob store by per-file digest.
+
+    Returns {} if any blob is missing (e.g. collected after BLOB_RETENTION_DAYS),
+    so callers treat the project as having no existing code.
+    """
+    try:
+        return {key: blob_store.get(digest) for key, digest in (code_refs or {}).items()}
+    except FileNotFoundError as e:
+        logger.warning(f"Generated code is no longer in the blob store: {os.path.basename(e.filename or '')}")
+        return {}
+
+# Fair-share build scheduling across tenants (keyed by email)
+BUILD_WORKERS = int(os.environ.get('BUILD_WORKERS', '4'))
+TENANT_MAX_CONCURRENT = int(os.environ.get('TENANT_MAX_CONCURRENT', '1'))
+TENANT_MAX_QUEUED = int(os.environ.get('TENANT_MAX_QUEUED', '20'))
+TENANT_DAILY_REQUESTS = int(os.environ.get('TENANT_DAILY_REQUESTS', '100'))
+TENANT_DAILY_TOKENS = int(os.environ.get('TENANT_DAILY_TOKENS', '2000000'))
+TENANT_WEIGHTS = json.loads(os.environ.get('TENANT_WEIGHTS', '{}'))
+
+class QuotaExceeded(Exception):
+    """Raised when a tenant is over its request quota, token budget or queue limit"""
+
+class FairScheduler:
+    """Weighted round-robin scheduler for build jobs.
+
+    Each tenant has its own FIFO queue. Workers take up to `weight` jobs from a
+    tenant before moving to the next one, and never run more than
+    `max_concurrent` jobs for the same tenant, so one busy submitter cannot
+    starve everyone else.
+
+    Queues are per process, but quotas, token budgets and the queued/running
+    counts used for the per-tenant limits come from the shared job store, so
+    the limits hold across all workers on the host and survive restarts.
+    """
+
+    def __init__(self, store, worker_count, max_concurrent, max_queued, daily_requests, daily_tokens, weights=None, poll_interval=1.0):
+        self.store = store
+        self.worker_count = worker_count
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.daily_requests = daily_requests
+        self.daily_tokens = daily_tokens
+        self.weights = weights or {}
+        self.poll_interval = poll_interval
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._ring = deque()
+        self._credits = {}
+        self._running = {}
+        self._workers_pid = None
+
+    def _weight(self, tenant):
+        return max(1, int(self.weights.get(tenant, 1)))
+
+    def _ensure_workers(self):
+        # Workers are started on first use so they also exist in forked children
+        if self._workers_pid == os.getpid():
+            return
+        self._workers_pid = os.getpid()
+        for i in range(self.worker_count):
+            worker = threading.Thread(target=self._worker, name=f"build-worker-{i}", daemon=True)
+            worker.start()
+
+    def submit(self, tenant, project_id, fn, *args, count_request=True):
+        """Queue a job for a tenant and return the number of that tenant's jobs ahead of it"""
+        queued_elsewhere, running_elsewhere = self.store.tenant_activity(tenant, exclude=project_id)
+        with self._cond:
+            queued_here = len(self._queues.get(tenant, ()))
+        if queued_here + queued_elsewhere >= self.max_queued:
+            raise QuotaExceeded(f"Too many queued builds for {tenant} (limit {self.max_queued}). Wait for earlier builds to finish.")
+
+        exceeded = self.store.reserve_request(tenant, self.daily_requests, self.daily_tokens, count_request)
+        if exceeded == 'requests':
+            raise QuotaExceeded(f"Daily request quota of {self.daily_requests} reached for {tenant}. Try again tomorrow.")
+        if exceeded == 'tokens':
+            raise QuotaExceeded(f"Daily LLM token budget of {self.daily_tokens} exhausted for {tenant}. Try again tomorrow.")
+
+        with self._cond:
+            queue = self._queues.get(tenant)
+            if queue is None:
+                queue = self._queues[tenant] = deque()
+                self._ring.append(tenant)
+            # Carry the caller's context (e.g. the active trace span) to the worker
+            queue.append((project_id, fn, args, contextvars.copy_context()))
+            jobs_ahead = len(queue) - 1 + self._running.get(tenant, 0) + queued_elsewhere + running_elsewhere
+
+            self._ensure_workers()
+            self._cond.notify()
+            return jobs_ahead
+
+    def record_tokens(self, tenant, tokens):
+        """Charge LLM token usage against a tenant's daily budget"""
+        if not tenant or not tokens:
+            return
+        self.store.add_tokens(tenant, tokens)
+
+    def _next_job(self, running_elsewhere):
+        # Tenants in the ring always have a non-empty queue
+        for _ in range(len(self._ring)):
+            tenant = self._ring[0]
+            running = self._running.get(tenant, 0) + running_elsewhere.get(tenant, 0)
+            if running >= self.max_concurrent:
+                self._ring.rotate(-1)
+                continue
+
+            queue = self._queues[tenant]
+            job = queue.popleft()
+            credits = self._credits.get(tenant, self._weight(tenant)) - 1
+
+            if not queue:
+                self._ring.popleft()
+                del self._queues[tenant]
+                self._credits.pop(tenant, None)
+            elif credits <= 0:
+                self._ring.rotate(-1)
+                self._credits[tenant] = self._weight(tenant)
+            else:
+                self._credits[tenant] = credits
+            return tenant, job
+        return None
+
+    def _worker(self):
+        while True:
+            # Read other workers' running counts before taking the lock, so
+            # submit() never waits behind SQLite
+            try:
+                running_elsewhere = self.store.running_by_tenant()
+            except Exception as e:
+                logger.warning(f"Could not read running builds from the job store: {str(e)}")
+                time.sleep(self.poll_interval)
+                continue
+            with self._cond:
+                picked = self._next_job(running_elsewhere)
+                if picked is None:
+                    # Builds finishing in other workers do not notify us, so poll
+                    self._cond.wait(self.poll_interval if self._ring else None)
+                    continue
+                tenant, (project_id, fn, args, context) = picked
+                self._running[tenant] = self._running.get(tenant, 0) + 1
+
+            try:
+                context.run(fn, *args)
+            except Exception as e:
+                logger.exception(f"Build worker error for {project_id}: {str(e)}")
+            finally:
+                set_log_context()
+                try:
+                    self.store.set_executing(project_id, False)
+                except Exception as e:
+                    logger.warning(f"Could not clear executing flag for {project_id}: {str(e)}")
+                with self._cond:
+                    self._running[tenant] -= 1
+                    if not self._running[tenant]:
+                        del self._running[tenant]
+                    self._cond.notify_all()
+
+# Durable build checkpoints so interrupted jobs can resume after a crash or deploy
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', os.path.join(DATA_DIR, 'jobs.sqlite3'))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '180'))
+JOB_SWEEP_INTERVAL = int(os.environ.get('JOB_SWEEP_INTERVAL', '30'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+MAINTENANCE_INTERVAL = int(os.environ.get('MAINTENANCE_INTERVAL', '3600'))
+JOB_RETENTION_DAYS = float(os.environ.get('JOB_RETENTION_DAYS', '30'))
+
+def worker_id():
+    """Identify this process as a lease owner"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class JobStore:
+    """SQLite-backed build jobs with per-stage checkpoints and worker leases.
+
+    A job is 'running' until it is 'done' or 'failed'. The process working on
+    a job holds a lease on it and renews it periodically; if the process dies
+    the lease expires and another worker can claim the job and resume it from
+    its last checkpointed stage.
+    """
+
+    def __init__(self, path, lease_seconds):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._initialized = False
+        self._held = set()
+        self._held_lock = threading.Lock()
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS build_jobs (
+                    project_id TEXT PRIMARY KEY,
+                    tenant TEXT,
+                    request TEXT,
+                    checkpoint TEXT,
+                    stage TEXT,
+                    status TEXT,
+                    message TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    executing INTEGER DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    updated_at REAL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS tenant_usage (
+                    tenant TEXT,
+                    day TEXT,
+                    requests INTEGER DEFAULT 0,
+                    tokens INTEGER DEFAULT 0,
+                    PRIMARY KEY (tenant, day)
+                )"""
+            )
+            self._initialized = True
+        return conn
+
+    def _hold(self, project_id, held=True):
+        with self._held_lock:
+            if held:
+                self._held.add(project_id)
+            else:
+                self._held.discard(project_id)
+
+    @staticmethod
+    def _decode(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['request'] = json.loads(job['request'] or '{}')
+        job['checkpoint'] = json.loads(job['checkpoint'] or '{}')
+        return job
+
+    def load(self, project_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM build_jobs WHERE project_id = ?", (project_id,)).fetchone()
+        return self._decode(row)
+
+    @staticmethod
+    def _replace(conn, job):
+        row = dict(job)
+        row['request'] = json.dumps(row.get('request') or {})
+        row['checkpoint'] = json.dumps(row.get('checkpoint') or {})
+        row['updated_at'] = time.time()
+        columns = ', '.join(row)
+        placeholders = ', '.join('?' for _ in row)
+        conn.execute(f"INSERT OR REPLACE INTO build_jobs ({columns}) VALUES ({placeholders})", tuple(row.values()))
+
+    def save(self, job):
+        """Insert or replace a whole job record"""
+        with closing(self._connect()) as conn:
+            self._replace(conn, job)
+        if job.get('status') == 'running' and job.get('lease_owner') == worker_id():
+            self._hold(job['project_id'])
+
+    def delete(self, project_id):
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM build_jobs WHERE project_id = ?", (project_id,))
+        self._hold(project_id, held=False)
+
+    def create(self, project_id, tenant, request_data, checkpoint=None):
+        """Register a new job, leased to this process.
+
+        Returns False without changing anything if a job for this project is
+        still running, so a finished job is the only kind ever replaced.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM build_jobs WHERE project_id = ?", (project_id,)).fetchone()
+            if row is not None and row['status'] == 'running':
+                conn.execute("ROLLBACK")
+                return False
+            self._replace(conn, {
+                'project_id': project_id,
+                'tenant': tenant,
+                'request': request_data,
+                'checkpoint': checkpoint or {},
+                'stage': None,
+                'status': 'running',
+                'message': None,
+                'attempts': 0,
+                'lease_owner': worker_id(),
+                'lease_expires': time.time() + self.lease_seconds
+            })
+            conn.execute("COMMIT")
+        self._hold(project_id)
+        return True
+
+    def start(self, project_id):
+        """Record an execution attempt and return the job with its checkpoint"""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE build_jobs SET attempts = attempts + 1, executing = 1, lease_owner = ?, lease_expires = ?, updated_at = ? WHERE project_id = ?",
+                (worker_id(), time.time() + self.lease_seconds, time.time(), project_id)
+            )
+            row = conn.execute("SELECT * FROM build_jobs WHERE project_id = ?", (project_id,)).fetchone()
+        if row is not None:
+            self._hold(project_id)
+        return self._decode(row)
+
+    def checkpoint(self, project_id, stage, **outputs):
+        """Merge a completed stage's outputs into the job's checkpoint"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT checkpoint FROM build_jobs WHERE project_id = ?", (project_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return
+            checkpoint = json.loads(row['checkpoint'] or '{}')
+            checkpoint.update(outputs)
+            conn.execute(
+                "UPDATE build_jobs SET checkpoint = ?, stage = ?, lease_expires = ?, updated_at = ? WHERE project_id = ?",
+                (json.dumps(checkpoint), stage, time.time() + self.lease_seconds, time.time(), project_id)
+            )
+            conn.execute("COMMIT")
+
+    def drop_attachments(self, project_id):
+        """Keep only attachment names in the stored request once they are no longer needed"""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT request FROM build_jobs WHERE project_id = ?", (project_id,)).fetchone()
+            request_data = json.loads(row['request'] or '{}') if row else {}
+            if not request_data.get('attachments'):
+                conn.execute("ROLLBACK")
+                return
+            request_data['attachments'] = [{'name': attachment.get('name')} for attachment in request_data['attachments']]
+            conn.execute("UPDATE build_jobs SET request = ? WHERE project_id = ?", (json.dumps(request_data), project_id))
+            conn.execute("COMMIT")
+
+    def finish(self, project_id, status, message=None):
+        """Mark a job 'done' or 'failed' and release its lease"""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE build_jobs SET status = ?, message = ?, executing = 0, lease_owner = NULL, lease_expires = NULL, updated_at = ? WHERE project_id = ?",
+                (status, message, time.time(), project_id)
+            )
+        self._hold(project_id, held=False)
+        self.drop_attachments(project_id)
+
+    def finished_jobs(self, limit):
+        """Return up to `limit` of the most recently completed jobs, oldest first"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT * FROM (SELECT * FROM build_jobs WHERE status = 'done' ORDER BY updated_at DESC LIMIT ?) ORDER BY updated_at",
+                (limit,)
+            ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def referenced_blobs(self):
+        """Return the digests of every blob a stored job's checkpoint points to"""
+        digests = set()
+        with closing(self._connect()) as conn:
+            for row in conn.execute("SELECT checkpoint FROM build_jobs"):
+                checkpoint = json.loads(row['checkpoint'] or '{}')
+                for key in ('code_refs', 'previous_code_refs'):
+                    digests.update((checkpoint.get(key) or {}).values())
+        return digests
+
+    def purge_finished(self, max_age_seconds):
+        """Delete done and failed jobs last updated more than max_age_seconds ago"""
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "DELETE FROM build_jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - max_age_seconds,)
+            )
+        return cursor.rowcount
+
+    def set_executing(self, project_id, executing):
+        """Flag whether a worker thread is currently running this job"""
+        with closing(self._connect()) as conn:
+            conn.execute("UPDATE build_jobs SET executing = ? WHERE project_id = ?", (1 if executing else 0, project_id))
+
+    def tenant_activity(self, tenant, exclude=None):
+        """Return (queued, running) counts of a tenant's jobs leased to other processes"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                """SELECT
+                    SUM(CASE WHEN executing = 0 AND stage IS NULL THEN 1 ELSE 0 END) AS queued,
+                    SUM(CASE WHEN executing = 1 THEN 1 ELSE 0 END) AS running
+                FROM build_jobs
+                WHERE tenant = ? AND status = 'running' AND lease_owner != ? AND lease_expires > ? AND project_id != ?""",
+                (tenant, worker_id(), time.time(), exclude or '')
+            ).fetchone()
+        return row['queued'] or 0, row['running'] or 0
+
+    def running_by_tenant(self):
+        """Return {tenant: running jobs} for jobs executing in other processes"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                """SELECT tenant, COUNT(*) AS running FROM build_jobs
+                WHERE executing = 1 AND status = 'running' AND lease_owner != ? AND lease_expires > ?
+                GROUP BY tenant""",
+                (worker_id(), time.time())
+            ).fetchall()
+        return {row['tenant']: row['running'] for row in rows}
+
+    def reserve_request(self, tenant, max_requests, max_tokens, count_request=True):
+        """Atomically check today's quota and count a request.
+
+        Returns None if allowed, or 'requests' / 'tokens' for the exhausted limit.
+        """
+        today = datetime.now().date().isoformat()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT requests, tokens FROM tenant_usage WHERE tenant = ? AND day = ?", (tenant, today)).fetchone()
+            requests_today, tokens_today = (row['requests'], row['tokens']) if row else (0, 0)
+            if count_request and requests_today >= max_requests:
+                conn.execute("ROLLBACK")
+                return 'requests'
+            if tokens_today >= max_tokens:
+                conn.execute("ROLLBACK")
+                return 'tokens'
+            if count_request:
+                conn.execute(
+                    "INSERT INTO tenant_usage (tenant, day, requests) VALUES (?, ?, 1) ON CONFLICT (tenant, day) DO UPDATE SET requests = requests + 1",
+                    (tenant, today)
+                )
+            conn.execute("COMMIT")
+        return None
+
+    def add_tokens(self, tenant, tokens):
+        """Charge LLM tokens against today's budget"""
+        today = datetime.now().date().isoformat()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO tenant_usage (tenant, day, tokens) VALUES (?, ?, ?) ON CONFLICT (tenant, day) DO UPDATE SET tokens = tokens + excluded.tokens",
+                (tenant, today, tokens)
+            )
+
+    def release(self, project_id, count_attempt=False):
+        """Give up a lease so another sweep can claim the job"""
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE build_jobs SET attempts = attempts + ?, lease_owner = NULL, lease_expires = 0 WHERE project_id = ?",
+                (1 if count_attempt else 0, project_id)
+            )
+        self._hold(project_id, held=False)
+
+    def renew_leases(self):
+        """Extend the leases of every job this process is working on"""
+        with self._held_lock:
+            held = list(self._held)
+        if not held:
+            return
+        with closing(self._connect()) as conn:
+            conn.executemany(
+                "UPDATE build_jobs SET lease_expires = ? WHERE project_id = ? AND lease_owner = ?",
+                [(time.time() + self.lease_seconds, project_id, worker_id()) for project_id in held]
+            )
+
+    def claim_expired(self):
+        """Take over running jobs whose lease has expired and return them"""
+        now = time.time()
+        claimed = []
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT project_id FROM build_jobs WHERE status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)",
+                (now,)
+            ).fetchall()
+            for row in rows:
+                cursor = conn.execute(
+                    "UPDATE build_jobs SET lease_owner = ?, lease_expires = ? WHERE project_id = ? AND status = 'running' AND (lease_expires IS NULL OR lease_expires < ?)",
+                    (worker_id(), now + self.lease_seconds, row['project_id'], now)
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(row['project_id'])
+
+        for project_id in claimed:
+            self._hold(project_id)
+        return [job for job in (self.load(project_id) for project_id in claimed) if job]
+
+job_store = JobStore(JOB_DB_PATH, JOB_LEASE_SECONDS)
+
+build_scheduler = FairScheduler(
+    job_store,
+    BUILD_WORKERS,
+    TENANT_MAX_CONCURRENT,
+    TENANT_MAX_QUEUED,
+    TENANT_DAILY_REQUESTS,
+    TENANT_DAILY_TOKENS,
+    TENANT_WEIGHTS
+)
+_sweeper_pid = None
+_sweeper_lock = threading.Lock()
+
+def ensure_recovery_sweeper():
+    """Start the recovery sweeper in this process if it is not running yet"""
+    global _sweeper_pid
+    if _sweeper_pid == os.getpid():
+        return
+    with _sweeper_lock:
+        if _sweeper_pid == os.getpid():
+            return
+        _sweeper_pid = os.getpid()
+        threading.Thread(target=recovery_sweeper, name="recovery-sweeper", daemon=True).start()
+
+def recovery_sweeper():
+    """Renew this worker's leases and resume jobs abandoned by dead workers"""
+    last_maintenance = 0
+    if SIMILARITY_REUSE:
+        try:
+            rebuild_similarity_index()
+        except Exception as e:
+            logger.exception(f"Could not rebuild the similarity index: {str(e)}")
+    while True:
+        try:
+            job_store.renew_leases()
+            for job in job_store.claim_expired():
+                resume_job(job)
+            if time.time() - last_maintenance >= MAINTENANCE_INTERVAL:
+                last_maintenance = time.time()
+                run_maintenance()
+        except Exception as e:
+            logger.exception(f"Recovery sweep failed: {str(e)}")
+        time.sleep(JOB_SWEEP_INTERVAL)
+
+def run_maintenance():
+    """Periodic cleanup of on-disk storage"""
+    purged = job_store.purge_finished(JOB_RETENTION_DAYS * 86400)
+    if purged:
+        logger.info(f"Removed {purged} finished build jobs")
+    # Blobs still referenced by a job or a project in memory are kept however old they are
+    referenced = job_store.referenced_blobs()
+    for project in list(projects_db.values()):
+        referenced.update((project.get('code_refs') or {}).values())
+    removed = blob_store.collect_garbage(BLOB_RETENTION_DAYS * 86400, keep=referenced)
+    if removed:
+        logger.info(f"Removed {removed} unused blobs")
+        similarity_index.prune(lambda code_refs: all(blob_store.exists(digest) for digest in code_refs.values()))
+
+def abandon_job(project_id, message):
+    """Fail a job that cannot be resumed"""
+    job_store.finish(project_id, 'failed', message)
+    projects_db[project_id] = {
+        'status': 'failed',
+        'message': message,
+        'created_at': datetime.now().isoformat()
+    }
+
+def resume_job(job):
+    """Requeue an interrupted job so it continues from its last checkpoint"""
+    project_id = job['project_id']
+    if job['attempts'] >= JOB_MAX_ATTEMPTS:
+        abandon_job(project_id, f"Build abandoned after {job['attempts']} interrupted attempts.")
+        return
+
+    logger.info(f"Resuming interrupted build {project_id} after stage {job['stage']}")
+    projects_db[project_id] = {
+        'status': 'processing',
+        'message': f"Resuming interrupted build after stage '{job['stage'] or 'queued'}'.",
+        'created_at': datetime.now().isoformat()
+    }
+    try:
+        build_scheduler.submit(job['tenant'], project_id, process_build_request, job['request'], count_request=False)
+    except QuotaExceeded as e:
+        # A refused requeue counts as an attempt so a tenant that stays over
+        # quota cannot keep the job cycling through the sweeper forever
+        if job['attempts'] + 1 >= JOB_MAX_ATTEMPTS:
+            abandon_job(project_id, f"Build could not be resumed: {str(e)}")
+        else:
+            logger.warning(f"Could not requeue {project_id}, will retry: {str(e)}")
+            job_store.release(project_id, count_attempt=True)
+
+# Near-duplicate detection over past submissions, used to start from a similar build
+SIMILARITY_REUSE = os.environ.get('SIMILARITY_REUSE', '1') == '1'
+SIMILARITY_THRESHOLD = float(os.environ.get('SIMILARITY_THRESHOLD', '0.8'))
+SIMILARITY_INDEX_SIZE = int(os.environ.get('SIMILARITY_INDEX_SIZE', '1000'))
+
+class SimilarityIndex:
+    """MinHash + LSH index over (task, brief, checks) word shingles.
+
+    Signatures are 64 MinHash values split into 16 bands of 4 rows; any
+    stored submission sharing a band with the query is a candidate, and
+    candidates are ranked by the fraction of matching MinHash values, which
+    estimates the Jaccard similarity of the shingle sets. Entries only match
+    queries with the same scope (see similarity_scope).
+    """
+
+    PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm=64, bands=16, shingle_size=3, max_entries=1000):
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.max_entries = max_entries
+        self._params = []
+        for i in range(num_perm):
+            seed = hashlib.sha256(f"minhash-{i}".encode()).digest()
+            a = int.from_bytes(seed[:8], 'big') % (self.PRIME - 1) + 1
+            b = int.from_bytes(seed[8:16], 'big') % self.PRIME
+            self._params.append((a, b))
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def submission_text(task, brief, checks):
+        return '\n'.join([task or '', brief or ''] + [str(check) for check in checks or []])
+
+    def signature(self, text):
+        words = re.findall(r'\w+', text.lower())
+        k = min(self.shingle_size, len(words)) or 1
+        shingles = {' '.join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big') for shingle in shingles]
+        return tuple(min((a * h + b) % self.PRIME for h in hashes) for a, b in self._params)
+
+    def _band_keys(self, signature, scope):
+        return [(scope, band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+
+    def add(self, key, text, value, scope=None):
+        """Index a submission; value is returned with matches (e.g. code digests)"""
+        signature = self.signature(text)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (signature, scope, value)
+            for band_key in self._band_keys(signature, scope):
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def remove(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def prune(self, keep):
+        """Drop entries whose value fails keep(value)"""
+        with self._lock:
+            stale = [key for key, (_, _, value) in self._entries.items() if not keep(value)]
+            for key in stale:
+                self._remove(key)
+        return len(stale)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if not entry:
+            return
+        for band_key in self._band_keys(entry[0], entry[1]):
+            bucket = self._buckets.get(band_key)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def query(self, text, threshold, exclude=None, scope=None):
+        """Return (key, similarity, value) for the closest stored submission in scope, or None"""
+        signature = self.signature(text)
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(signature, scope):
+                candidates |= self._buckets.get(band_key, set())
+            candidates.discard(exclude)
+
+            best = None
+            for key in candidates:
+                stored, _, value = self._entries[key]
+                similarity = sum(x == y for x, y in zip(signature, stored)) / len(signature)
+                if similarity >= threshold and (best is None or similarity > best[1]):
+                    best = (key, similarity, value)
+        return best
+
+similarity_index = SimilarityIndex(max_entries=SIMILARITY_INDEX_SIZE)
+
+def similarity_scope(tenant, attachments):
+    """Only reuse a build from the same submitter with the same attachment names"""
+    return (tenant, tuple(sorted(attachment.get('name', '') for attachment in attachments or [])))
+
+def rebuild_similarity_index():
+    """Index the most recent finished builds from the job store"""
+    for job in job_store.finished_jobs(SIMILARITY_INDEX_SIZE):
+        code_refs = job['checkpoint'].get('code_refs')
+        if not code_refs:
+            continue
+        data = job['request']
+        submission_text = SimilarityIndex.submission_text(data.get('task'), data.get('brief'), data.get('checks'))
+        similarity_index.add(job['project_id'], submission_text, code_refs, similarity_scope(job['tenant'], data.get('attachments')))
+
+# Sampling profiler for build jobs, switched on through the admin API
+ADMIN_SECRET = os.environ.get('ADMIN_SECRET')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'llm-app-builder-profiles'))
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', '200'))
+PROFILE_DEFAULTS = {'enabled': False, 'sample_percent': 5.0, 'interval_ms': 10, 'allocations': False}
+
+_current_profile = contextvars.ContextVar('current_profile', default=None)
+
+def frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class BuildProfiler:
+    """Wall-clock and allocation profiling for a sample of build jobs.
+
+    Settings live in a JSON file under PROFILE_DIR so the admin switch applies
+    to every worker on the host. One sampler thread walks the stacks of all
+    threads currently running a profiled build (including helper threads that
+    enter profile_thread); results are written per
+    build as collapsed stacks ("frame;frame;frame count"), the input format
+    of flamegraph.pl and speedscope. Allocation profiles diff tracemalloc
+    snapshots taken at the start and end of the build, so they include
+    allocations made by other threads in that window.
+    """
+
+    def __init__(self, directory, max_files):
+        self.directory = directory
+        self.max_files = max_files
+        self._settings = dict(PROFILE_DEFAULTS)
+        self._settings_mtime = None
+        self._active = {}
+        self._cond = threading.Condition()
+        self._sampler_pid = None
+        self._tracemalloc_users = 0
+        self._started_tracemalloc = False
+
+    def _settings_path(self):
+        return os.path.join(self.directory, 'settings.json')
+
+    def settings(self):
+        """Return the current settings, re-reading the file only when it changes"""
+        try:
+            mtime = os.stat(self._settings_path()).st_mtime
+        except OSError:
+            return self._settings
+        if mtime != self._settings_mtime:
+            with open(self._settings_path(), encoding='utf-8') as f:
+                self._settings = {**PROFILE_DEFAULTS, **json.load(f)}
+            self._settings_mtime = mtime
+        return self._settings
+
+    def update_settings(self, changes):
+        settings = {**self.settings(), **changes}
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._settings_path()}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(settings, f)
+        os.replace(tmp_path, self._settings_path())
+        return self.settings()
+
+    def maybe_start(self, project_id):
+        """Start profiling the current thread for a sampled share of builds"""
+        settings = self.settings()
+        if not settings['enabled'] or random.random() * 100 >= settings['sample_percent']:
+            return None
+
+        profile = {
+            'project_id': project_id,
+            'thread_id': threading.get_ident(),
+            'stacks': {},
+            'allocations': bool(settings['allocations']),
+            'snapshot': None
+        }
+        if profile['allocations']:
+            with self._cond:
+                if not self._tracemalloc_users and not tracemalloc.is_tracing():
+                    tracemalloc.start(25)
+                    self._started_tracemalloc = True
+                self._tracemalloc_users += 1
+            profile['snapshot'] = tracemalloc.take_snapshot()
+
+        with self._cond:
+            self._active[profile['thread_id']] = profile
+            if self._sampler_pid != os.getpid():
+                self._sampler_pid = os.getpid()
+                threading.Thread(target=self._sample, name="build-profiler", daemon=True).start()
+            self._cond.notify()
+        _current_profile.set(profile)
+        logger.info(f"Profiling build {project_id}")
+        return profile
+
+    @contextmanager
+    def profile_thread(self):
+        """Sample the current thread as part of the profiled build in this context, if any"""
+        profile = _current_profile.get()
+        if profile is None:
+            yield
+            return
+        thread_id = threading.get_ident()
+        with self._cond:
+            self._active[thread_id] = profile
+            self._cond.notify()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active.pop(thread_id, None)
+
+    def _sample(self):
+        while True:
+            with self._cond:
+                while not self._active:
+                    self._cond.wait()
+                profiles = dict(self._active)
+            frames = sys._current_frames()
+            for thread_id, profile in profiles.items():
+                frame = frames.get(thread_id)
+                labels = []
+                while frame is not None:
+                    labels.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                if labels:
+                    stack = ';'.join(reversed(labels))
+                    profile['stacks'][stack] = profile['stacks'].get(stack, 0) + 1
+            time.sleep(self.settings()['interval_ms'] / 1000)
+
+    def finish(self, profile):
+        """Stop profiling and write the collapsed stacks for this build"""
+        with self._cond:
+            for thread_id in [thread_id for thread_id, active in self._active.items() if active is profile]:
+                del self._active[thread_id]
+        _current_profile.set(None)
+
+        # Each build of a project (round 1, round 2, resumes) gets its own files
+        name = f"{profile['project_id']}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+        self._write(name, 'wall', profile['stacks'])
+
+        if profile['allocations']:
+            diff = tracemalloc.take_snapshot().compare_to(profile['snapshot'], 'traceback')
+            allocations = {}
+            for stat in diff:
+                if stat.size_diff <= 0:
+                    continue
+                stack = ';'.join(f"{os.path.basename(f.filename)}:{f.lineno}" for f in stat.traceback)
+                allocations[stack] = allocations.get(stack, 0) + stat.size_diff
+            self._write(name, 'alloc', allocations)
+            with self._cond:
+                self._tracemalloc_users -= 1
+                # Leave tracing on if someone else (e.g. PYTHONTRACEMALLOC) started it
+                if not self._tracemalloc_users and self._started_tracemalloc:
+                    tracemalloc.stop()
+                    self._started_tracemalloc = False
+
+    def _write(self, name, kind, stacks):
+        if not stacks:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{name}.{kind}.collapsed")
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.items():
+                f.write(f"{stack} {count}\n")
+
+        profiles = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.name.endswith('.collapsed')),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in profiles[:max(0, len(profiles) - self.max_files)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def list_profiles(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(entry.name for entry in os.scandir(self.directory) if entry.name.endswith('.collapsed'))
+
+    def aggregate(self, kind):
+        """Sum the collapsed stacks of every stored profile of one kind"""
+        stacks = {}
+        for name in self.list_profiles():
+            if not name.endswith(f".{kind}.collapsed"):
+                continue
+            with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                for line in f:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if stack:
+                        stacks[stack] = stacks.get(stack, 0) + int(count)
+        return stacks
+
+build_profiler = BuildProfiler(PROFILE_DIR, PROFILE_MAX_FILES)
+
+def render_flame_graph(stacks, title):
+    """Render collapsed stacks as a simple self-contained SVG flame graph"""
+    root = {'count': 0, 'children': {}}
+    for stack, count in stacks.items():
+        node = root
+        node['count'] += count
+        for frame in stack.split(';'):
+            node = node['children'].setdefault(frame, {'count': 0, 'children': {}})
+            node['count'] += count
+
+    width, row_height = 1200, 18
+    rects = []
+    max_depth = 0
+
+    def layout(node, x, depth):
+        nonlocal max_depth
+        max_depth = max(max_depth, depth)
+        for name, child in sorted(node['children'].items()):
+            child_width = width * child['count'] / root['count']
+            if child_width >= 0.5:
+                rects.append((name, child['count'], x, depth, child_width))
+                layout(child, x, depth + 1)
+            x += child_width
+
+    if root['count']:
+        layout(root, 0.0, 0)
+
+    height = (max_depth + 1) * row_height + 30
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">',
+        f'<text x="4" y="14">{escape_xml(title)} ({root["count"]} samples)</text>'
+    ]
+    for name, count, x, depth, rect_width in rects:
+        y = height - (depth + 1) * row_height
+        hue = 20 + hash(name) % 40
+        label = escape_xml(name)
+        parts.append(
+            f'<g><title>{label} ({count}, {100 * count / root["count"]:.1f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{rect_width:.1f}" height="{row_height - 1}" fill="hsl({hue},90%,60%)"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + 12}">{label[:int(rect_width / 7)]}</text>' if rect_width > 35 else '')
+            + '</g>'
+        )
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+def escape_xml(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+def verify_admin(provided_secret):
+    """Verify the admin secret; admin endpoints are disabled when it is not set"""
+    if not ADMIN_SECRET or not provided_secret:
+        return False
+    return hmac.compare_digest(provided_secret, ADMIN_SECRET)
 
 def verify_secret(provided_secret):
     """Verify the secret key"""
@@ -34,7 +1506,303 @@ def verify_secret(provided_secret):
         return False
     return provided_secret == SECRET_KEY
 
-def generate_app_with_llm(brief, task, checks, attachments=None, existing_code=None, revision_request=None):
+# Request validation limits
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', str(10 * 1024 * 1024)))
+MAX_BRIEF_CHARS = int(os.environ.get('MAX_BRIEF_CHARS', '20000'))
+MAX_CHECKS = int(os.environ.get('MAX_CHECKS', '50'))
+MAX_ATTACHMENTS = int(os.environ.get('MAX_ATTACHMENTS', '10'))
+MAX_ATTACHMENT_BYTES = int(os.environ.get('MAX_ATTACHMENT_BYTES', str(5 * 1024 * 1024)))
+MAX_PROMPT_TOKENS = int(os.environ.get('MAX_PROMPT_TOKENS', '16000'))
+
+app.config['MAX_CONTENT_LENGTH'] = MAX_REQUEST_BYTES
+
+EMAIL_PATTERN = re.compile(r'[^@\s]+@[^@\s]+')
+URL_PATTERN = re.compile(r'https?://\S+')
+FILE_NAME_PATTERN = re.compile(r'[\w-][\w.-]*')
+DATA_URI_HEADER_PATTERN = re.compile(r'data:[\w.+-]+/[\w.+-]+(;[\w.+-]+=[\w.+-]+)*;base64')
+BASE64_PATTERN = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+
+def validate_attachment(attachment):
+    """Cheap structural checks on one attachment; returns an error message or None"""
+    if not isinstance(attachment, dict):
+        return "must be an object with 'name' and 'url'"
+    name = attachment.get('name')
+    url = attachment.get('url')
+    if not isinstance(name, str) or not FILE_NAME_PATTERN.fullmatch(name) or len(name) > 255:
+        return "has an invalid file name"
+    if not isinstance(url, str) or ',' not in url:
+        return "must have a base64 data URI as its url"
+    if len(url) > MAX_ATTACHMENT_BYTES * 4 // 3 + 256:
+        return f"is larger than {MAX_ATTACHMENT_BYTES} bytes"
+    header, encoded = url.split(',', 1)
+    if not DATA_URI_HEADER_PATTERN.fullmatch(header):
+        return "has an invalid data URI header"
+    if len(encoded) % 4 or not BASE64_PATTERN.fullmatch(encoded):
+        return "does not contain valid base64 data"
+    return None
+
+BUILD_REQUEST_SCHEMA = {
+    'email': {'type': str, 'max_length': 320, 'pattern': EMAIL_PATTERN},
+    'secret': {'type': str, 'max_length': 256},
+    'task': {'type': str, 'max_length': 200},
+    'brief': {'type': str, 'max_length': MAX_BRIEF_CHARS},
+    'nonce': {'type': str, 'max_length': 200},
+    'round': {'type': int, 'choices': (1, 2)},
+    'evaluation_url': {'type': str, 'max_length': 2048, 'pattern': URL_PATTERN, 'allow_empty': True},
+    'checks': {'type': list, 'max_items': MAX_CHECKS, 'item_type': str, 'item_max_length': 1000},
+    'attachments': {'type': list, 'max_items': MAX_ATTACHMENTS, 'item_validator': validate_attachment}
+}
+
+def compile_schema(schema):
+    """Turn a field schema into a flat list of validator functions.
+
+    Each validator takes the request dict and returns an error message or
+    None, so validating a request is a single pass with no schema lookups.
+    """
+    validators = []
+    for field, rules in schema.items():
+        def check(data, field=field, rules=rules):
+            value = data.get(field)
+            if value is None or (rules.get('allow_empty') and value == ''):
+                return None
+            expected = rules['type']
+            if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+                return f"'{field}' must be of type {expected.__name__}"
+            if 'max_length' in rules and len(value) > rules['max_length']:
+                return f"'{field}' must be at most {rules['max_length']} characters"
+            if 'pattern' in rules and not rules['pattern'].fullmatch(value):
+                return f"'{field}' is not valid"
+            if 'choices' in rules and value not in rules['choices']:
+                return f"'{field}' must be one of {', '.join(str(choice) for choice in rules['choices'])}"
+            if 'max_items' in rules and len(value) > rules['max_items']:
+                return f"'{field}' must have at most {rules['max_items']} items"
+            for index, item in enumerate(value if expected is list else ()):
+                if 'item_type' in rules and not isinstance(item, rules['item_type']):
+                    return f"'{field}[{index}]' must be of type {rules['item_type'].__name__}"
+                if 'item_max_length' in rules and len(item) > rules['item_max_length']:
+                    return f"'{field}[{index}]' must be at most {rules['item_max_length']} characters"
+                if 'item_validator' in rules:
+                    error = rules['item_validator'](item)
+                    if error:
+                        return f"'{field}[{index}]' {error}"
+            return None
+        validators.append(check)
+    return validators
+
+build_request_validators = compile_schema(BUILD_REQUEST_SCHEMA)
+
+def estimate_prompt_tokens(data, existing_code=None):
+    """Rough prompt size: about 4 characters per token plus the prompt template"""
+    chars = len(data.get('task') or '') + len(data.get('brief') or '') + len(existing_code or '')
+    chars += sum(len(check) for check in data.get('checks') or [])
+    chars += sum(len(attachment.get('name', '')) for attachment in data.get('attachments') or [])
+    return chars // 4 + 500
+
+def prompt_size_error(data, existing_code=None):
+    """Return an error message if the request's prompt would exceed MAX_PROMPT_TOKENS"""
+    tokens = estimate_prompt_tokens(data, existing_code)
+    if tokens > MAX_PROMPT_TOKENS:
+        return f"Request is too large: about {tokens} prompt tokens (limit {MAX_PROMPT_TOKENS})"
+    return None
+
+def validate_build_request(data):
+    """Validate a build request body; returns an error message or None"""
+    for validator in build_request_validators:
+        error = validator(data)
+        if error:
+            return error
+    return prompt_size_error(data)
+
+# LLM generation settings
+# GENERATION_MODE: 'single' (one completion), 'chunked' (plan + parallel parts)
+# or 'auto' (single, switching to chunked for large inputs or truncated output)
+GENERATION_MODE = os.environ.get('GENERATION_MODE', 'auto')
+LLM_MAX_TOKENS = int(os.environ.get('LLM_MAX_TOKENS', '8000'))
+LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', '10'))
+LLM_READ_TIMEOUT = float(os.environ.get('LLM_READ_TIMEOUT', '180'))
+CHUNK_PLAN_MAX_TOKENS = int(os.environ.get('CHUNK_PLAN_MAX_TOKENS', '1500'))
+CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS', '8000'))
+CHUNK_MAX_CONTINUATIONS = int(os.environ.get('CHUNK_MAX_CONTINUATIONS', '2'))
+CHUNKED_INPUT_CHARS = int(os.environ.get('CHUNKED_INPUT_CHARS', '12000'))
+
+def call_llm(prompt, max_tokens, tenant=None, partial=None):
+    """Send one chat completion to aipipe.org and return (content, finish_reason).
+
+    Pass the text of a reply that was cut off by max_tokens as `partial` to
+    get its continuation.
+    """
+    headers = {
+        "Authorization": f"Bearer {AIPIPE_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+    messages = [{"role": "user", "content": prompt}]
+    if partial:
+        messages += [
+            {"role": "assistant", "content": partial},
+            {"role": "user", "content": "Your reply was cut off. Continue exactly where it stopped, without repeating anything and without starting a new code block."}
+        ]
+
+    payload = {
+        "model": "openai/gpt-4o-mini",
+        "messages": messages,
+        "max_tokens": max_tokens
+    }
+
+    # Bounded so a hung call cannot hold a build worker (and its tenant's slot) forever
+    response = http_request(
+        'POST',
+        AIPIPE_API_URL,
+        headers=headers,
+        json=payload,
+        timeout=(LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)
+    )
+    response.raise_for_status()
+
+    response_data = response.json()
+
+    # Charge token usage against the submitter's daily budget
+    usage = response_data.get("usage") or {}
+    build_scheduler.record_tokens(tenant, usage.get("total_tokens", 0))
+
+    choice = response_data["choices"][0]
+    return choice["message"]["content"], choice.get("finish_reason")
+
+def strip_code_fence(content):
+    """Return the body of a reply wrapped in a fenced code block, or the reply unchanged.
+
+    Only a fence that opens the reply is removed, together with its info string
+    (e.g. ```css). A missing closing fence, as in a reply cut off by max_tokens,
+    is tolerated, and fenced blocks inside an unwrapped reply are left alone.
+    """
+    content = content.strip()
+    if not content.startswith("```"):
+        return content
+    body = content.split("\n", 1)[1] if "\n" in content else ""
+    lines = body.split("\n")
+    for index in range(len(lines) - 1, -1, -1):
+        if lines[index].strip() == "```":
+            lines = lines[:index]
+            break
+    return "\n".join(lines).strip()
+
+def extract_json_from_content(content):
+    """Parse the JSON object in an LLM reply, repairing it if needed"""
+    # Try to extract JSON from markdown code blocks
+    if "```json" in content:
+        json_start = content.find("```json") + 7
+        json_end = content.rfind("```")
+        json_str = content[json_start:json_end].strip()
+    elif "```" in content:
+        json_start = content.find("```") + 3
+        json_end = content.rfind("```")
+        json_str = content[json_start:json_end].strip()
+    else:
+        json_str = content
+
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError as e:
+        logger.warning(f"Initial JSON parse failed: {e}", extra={'payload': json_str})
+        json_str = repair_json_string(json_str)
+        try:
+            return json.loads(json_str)
+        except json.JSONDecodeError as e2:
+            logger.error(f"JSON parse failed after repair: {e2}", extra={'payload': json_str})
+            raise Exception(f"Failed to parse LLM response: {e2}")
+
+def assemble_html(html, css, js):
+    """Inline separately generated CSS and JavaScript into the HTML document"""
+    if css:
+        style = f"<style>\n{css}\n</style>\n"
+        head_end = html.rfind('</head>')
+        html = html[:head_end] + style + html[head_end:] if head_end != -1 else style + html
+    if js:
+        script = f"<script>\n{js}\n</script>\n"
+        body_end = html.rfind('</body>')
+        html = html[:body_end] + script + html[body_end:] if body_end != -1 else html + script
+    return html
+
+@traced('generate_app_chunked')
+def generate_app_chunked(brief, task, checks, attachment_context, existing_code=None, revision_request=None, tenant=None):
+    """Generate an application as a plan followed by parallel per-file completions.
+
+    The plan fixes section ids, element ids and class names so that the HTML,
+    CSS and JavaScript written by separate completions fit together. Parts are
+    returned as raw text (no JSON escaping) and assembled locally. The license
+    is left to create_github_repo's standard MIT text.
+    """
+    requirements = chr(10).join(f'- {check}' for check in checks)
+    if existing_code:
+        context = f"REVISION REQUEST: {revision_request}\n\nEXISTING CODE:\n{existing_code}\n"
+    else:
+        context = f"TASK: {task}\nBRIEF: {brief}\n"
+    context += f"{attachment_context}\n\nREQUIREMENTS:\n{requirements}"
+
+    plan_prompt = f"""You are an expert web developer planning a single-page web application.
+
+{context}
+
+Return a single JSON object describing the plan with this structure:
+{{
+  "title": "application title",
+  "sections": [{{"id": "section element id", "purpose": "what the section contains"}}],
+  "element_ids": ["every element id the JavaScript will use"],
+  "css_classes": ["main CSS class names"],
+  "behaviour": "short description of all interactive behaviour"
+}}"""
+    plan = extract_json_from_content(call_llm(plan_prompt, CHUNK_PLAN_MAX_TOKENS, tenant)[0])
+    plan_json = json.dumps(plan, indent=2)
+
+    parts = {
+        'html': "the complete index.html markup. Do not include any CSS or JavaScript; they are added separately. Use exactly the section ids, element ids and class names from the plan.",
+        'css': "the complete CSS stylesheet (without <style> tags). Use a modern, responsive and visually appealing design with vibrant colors, gradients and animations, styling the ids and classes from the plan.",
+        'js': "the complete JavaScript (without <script> tags) implementing the behaviour from the plan, using the element ids from the plan.",
+        'readme': "a professional README.md with setup and usage instructions."
+    }
+
+    project_id = getattr(_log_context, 'project_id', None)
+
+    def generate_part(name, instructions):
+        set_log_context(project_id, f'generate:{name}')
+        prompt = f"""You are an expert web developer writing one file of a single-page web application.
+
+{context}
+
+PLAN:
+{plan_json}
+
+Write {instructions} Return only the file content in a single fenced code block."""
+        # Pool threads are not the build thread, so register them with the profiler
+        with build_profiler.profile_thread():
+            content, finish_reason = call_llm(prompt, CHUNK_MAX_TOKENS, tenant)
+            continuations = 0
+            while finish_reason == 'length':
+                # Never deploy a truncated file: continue it, or fail the build
+                if continuations >= CHUNK_MAX_CONTINUATIONS:
+                    raise Exception(f"Chunked part '{name}' was still incomplete after {continuations} continuations")
+                continuations += 1
+                logger.info(f"Chunked part '{name}' hit max_tokens; requesting continuation {continuations}")
+                more, finish_reason = call_llm(prompt, CHUNK_MAX_TOKENS, tenant, partial=content)
+                content += re.sub(r'\A\s*```[\w.+-]+[^\n]*\n', '', more)
+        return strip_code_fence(content)
+
+    with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, generate_part, name, instructions)
+            for name, instructions in parts.items()
+        }
+        results = {name: future.result() for name, future in futures.items()}
+
+    return {
+        'html': assemble_html(results['html'], results['css'], results['js']),
+        'css': results['css'],
+        'js': results['js'],
+        'readme': results['readme']
+    }
+
+@traced('generate_app_with_llm')
+def generate_app_with_llm(brief, task, checks, attachments=None, existing_code=None, revision_request=None, tenant=None):
     """Generate application code using aipipe.org"""
 
     if not AIPIPE_API_KEY:
@@ -46,6 +1814,15 @@ def generate_app_with_llm(brief, task, checks, attachments=None, existing_code=N
         file_names = [attachment['name'] for attachment in attachments]
         attachment_context = f"\n\nThe following files are available in the root directory of the application: {', '.join(file_names)}. You MUST write code to utilize these files if relevant to the task (e.g., load the CSV data)."
 
+    chunked_args = (brief, task, checks, attachment_context, existing_code, revision_request, tenant)
+    input_chars = len(brief or '') + len(existing_code or '')
+    if GENERATION_MODE == 'chunked' or (GENERATION_MODE == 'auto' and input_chars > CHUNKED_INPUT_CHARS):
+        try:
+            return generate_app_chunked(*chunked_args)
+        except Exception as e:
+            logger.error(f"LLM Error: {str(e)}")
+            raise Exception(f"Failed to generate code: {str(e)}")
+
     # Build the prompt
     if existing_code:
         prompt = f"""You are an expert web developer. Update the existing application based on the revision request.
@@ -97,53 +1874,22 @@ Create a modern, responsive, and fully functional single-page application. Inclu
 IMPORTANT: The HTML should be self-contained with CSS in <style> tags and JS in <script> tags. Make it visually appealing with modern design trends."""
 
     try:
-        # Make request to aipipe.org API
-        headers = {
-            "Authorization": f"Bearer {AIPIPE_API_KEY}",
-            "Content-Type": "application/json"
-        }
-
-        payload = {
-            "model": "openai/gpt-4o-mini",
-            "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": 8000
-        }
-
-        response = requests.post(AIPIPE_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
+        content, finish_reason = call_llm(prompt, LLM_MAX_TOKENS, tenant)
 
-        response_data = response.json()
-
-        # Extract JSON from response
-        content = response_data["choices"][0]["message"]["content"]
-
-        # Try to extract JSON from markdown code blocks
-        if "```json" in content:
-            json_start = content.find("```json") + 7
-            json_end = content.rfind("```")
-            json_str = content[json_start:json_end].strip()
-        elif "```" in content:
-            json_start = content.find("```") + 3
-            json_end = content.rfind("```")
-            json_str = content[json_start:json_end].strip()
-        else:
-            json_str = content
+        if GENERATION_MODE == 'auto' and finish_reason == 'length':
+            logger.warning("Completion hit max_tokens; switching to chunked generation")
+            return generate_app_chunked(*chunked_args)
 
         try:
-            code_data = json.loads(json_str)
-        except json.JSONDecodeError as e:
-            print(f"Initial JSON parse failed: {e}. Raw content: {json_str}")
-            json_str = repair_json_string(json_str)
-            try:
-                code_data = json.loads(json_str)
-            except json.JSONDecodeError as e2:
-                print(f"JSON parse failed after repair: {e2}. Repaired content: {json_str}")
-                raise Exception(f"Failed to parse LLM response: {e2}")
-
-        return code_data
+            return extract_json_from_content(content)
+        except Exception as e:
+            if GENERATION_MODE != 'auto':
+                raise
+            logger.warning(f"Falling back to chunked generation: {str(e)}")
+            return generate_app_chunked(*chunked_args)
 
     except Exception as e:
-        print(f"LLM Error: {str(e)}")
+        logger.error(f"LLM Error: {str(e)}")
         raise Exception(f"Failed to generate code: {str(e)}")
 
 def repair_json_string(json_str):
@@ -177,28 +1923,38 @@ def repair_json_string(json_str):
 
     return repaired_str
 
+def decode_attachment(url):
+    """Decode a base64 data URI into bytes"""
+    header, encoded = url.split(',', 1)
+    return base64.b64decode(encoded)
+
+@traced('create_github_repo')
 def create_github_repo(repo_name, code_data, email, attachments=None):
     """Create GitHub repository and deploy to Pages"""
 
-    if not github_client:
+    github = get_github_client()
+    if not github:
         raise Exception("GitHub token not configured")
 
     try:
-        user = github_client.get_user()
+        with start_span('github.get_user'):
+            user = github.get_user()
 
         # Create repository
         try:
-            repo = user.create_repo(
-                repo_name,
-                description=f"Auto-generated application for {email}",
-                homepage=f"https://{user.login}.github.io/{repo_name}",
-                has_issues=True,
-                has_wiki=False,
-                auto_init=False
-            )
+            with start_span('github.create_repo', repo=repo_name):
+                repo = user.create_repo(
+                    repo_name,
+                    description=f"Auto-generated application for {email}",
+                    homepage=f"https://{user.login}.github.io/{repo_name}",
+                    has_issues=True,
+                    has_wiki=False,
+                    auto_init=False
+                )
         except Exception as e:
             if "name already exists" in str(e).lower():
-                repo = user.get_repo(repo_name)
+                with start_span('github.get_repo', repo=repo_name):
+                    repo = user.get_repo(repo_name)
             else:
                 raise e
 
@@ -238,12 +1994,9 @@ SOFTWARE.''')
                     continue
 
                 try:
-                    # Decode data URI
-                    header, encoded = url.split(',', 1)
-                    content_bytes = base64.b64decode(encoded)
-                    files_to_commit[name] = content_bytes
+                    files_to_commit[name] = decode_attachment(url)
                 except Exception as e:
-                    print(f"Failed to decode attachment {name}: {e}")
+                    logger.warning(f"Failed to decode attachment {name}: {e}")
 
         commit_sha = None
         for path, content in files_to_commit.items():
@@ -251,41 +2004,42 @@ SOFTWARE.''')
                 continue
             try:
                 # Check if file exists to update it
-                existing_file = repo.get_contents(path, ref="main")
-                update_result = repo.update_file(
-                    path,
-                    f"Update {path}",
-                    content,
-                    existing_file.sha,
-                    branch="main"
-                )
+                with start_span('github.get_contents', path=path):
+                    existing_file = repo.get_contents(path, ref="main")
+                with start_span('github.update_file', path=path, payload_size=len(content)):
+                    update_result = repo.update_file(
+                        path,
+                        f"Update {path}",
+                        content,
+                        existing_file.sha,
+                        branch="main"
+                    )
                 commit_sha = update_result['commit'].sha
             except Exception:
                 # Create file if it does not exist
-                create_result = repo.create_file(
-                    path,
-                    f"Create {path}",
-                    content,
-                    branch="main"
-                )
+                with start_span('github.create_file', path=path, payload_size=len(content)):
+                    create_result = repo.create_file(
+                        path,
+                        f"Create {path}",
+                        content,
+                        branch="main"
+                    )
                 commit_sha = create_result['commit'].sha
 
-        # Enable GitHub Pages
+        # Enable GitHub Pages (409 means it is already enabled)
         try:
             pages_url = f"https://api.github.com/repos/{user.login}/{repo_name}/pages"
-            headers = {
-                "Authorization": f"token {GITHUB_TOKEN}",
-                "Accept": "application/vnd.github.v3+json"
-            }
             payload = {
                 "source": {
                     "branch": "main",
                     "path": "/"
                 }
             }
-            requests.post(pages_url, json=payload, headers=headers)
+            response = http_request('POST', pages_url, json=payload, headers=github_api_headers(), timeout=10)
+            if response.status_code not in (201, 409):
+                logger.warning(f"Pages setup returned {response.status_code}", extra={'payload': response.text})
         except Exception as e:
-            print(f"Pages setup: {str(e)}")
+            logger.warning(f"Pages setup: {str(e)}")
 
         repo_url = repo.html_url
         pages_url = f"https://{user.login}.github.io/{repo_name}"
@@ -294,13 +2048,143 @@ SOFTWARE.''')
             "repo_url": repo_url,
             "pages_url": pages_url,
             "commit_sha": commit_sha,
+            "owner": user.login,
+            "repo_name": repo_name,
             "success": True
         }
 
     except Exception as e:
-        print(f"GitHub Error: {str(e)}")
+        logger.error(f"GitHub Error: {str(e)}")
         raise Exception(f"Failed to create repository: {str(e)}")
 
+def github_api_headers():
+    """Headers for direct GitHub REST API calls"""
+    return {
+        "Authorization": f"token {GITHUB_TOKEN}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+
+# GitHub Pages readiness polling
+PAGES_READY_TIMEOUT = int(os.environ.get('PAGES_READY_TIMEOUT', '600'))
+PAGES_POLL_MIN_DELAY = float(os.environ.get('PAGES_POLL_MIN_DELAY', '2'))
+PAGES_POLL_MAX_DELAY = float(os.environ.get('PAGES_POLL_MAX_DELAY', '30'))
+
+class PagesWatcher:
+    """Single background poller that waits for GitHub Pages deployments to go live.
+
+    All pending projects share one thread. Each project is polled on its own
+    schedule: quickly while its Pages build is running, backing off while it
+    is still queued or the API is failing. Once the site serves the expected
+    commit (or the deadline passes) its callback runs on a short-lived thread.
+    """
+
+    def __init__(self, timeout, min_delay, max_delay):
+        self.timeout = timeout
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._thread_pid = None
+
+    def _ensure_thread(self):
+        if self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name="pages-watcher", daemon=True).start()
+
+    def watch(self, project_id, deployment, on_ready):
+        """Call on_ready(live, time_to_live) once the deployment is served"""
+        now = time.monotonic()
+        with self._cond:
+            self._pending[project_id] = {
+                'deployment': deployment,
+                'on_ready': on_ready,
+                'context': contextvars.copy_context(),
+                'started': now,
+                'deadline': now + self.timeout,
+                'next_poll': now + self.min_delay,
+                'delay': self.min_delay
+            }
+            self._ensure_thread()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                now = time.monotonic()
+                next_poll = min(entry['next_poll'] for entry in self._pending.values())
+                if next_poll > now:
+                    self._cond.wait(next_poll - now)
+                    continue
+                due = [(pid, entry) for pid, entry in self._pending.items() if entry['next_poll'] <= now]
+
+            for project_id, entry in due:
+                try:
+                    self._poll(project_id, entry)
+                except Exception as e:
+                    # Keep the watcher alive for every other project; retry this one later
+                    logger.exception(f"Pages watcher error for {project_id}: {str(e)}")
+                    entry['delay'] = min(entry['delay'] * 2, self.max_delay)
+                    entry['next_poll'] = time.monotonic() + entry['delay']
+
+    def _poll(self, project_id, entry):
+        try:
+            state = entry['context'].run(check_pages_deployment, entry['deployment'])
+        except Exception as e:
+            # Unexpected responses count as not ready yet, so the deadline still applies
+            logger.exception(f"Pages check failed for {project_id}: {str(e)}")
+            state = 'pending'
+        now = time.monotonic()
+
+        if state == 'live' or now >= entry['deadline']:
+            with self._cond:
+                self._pending.pop(project_id, None)
+            live = state == 'live'
+            time_to_live = round(now - entry['started'], 2)
+            threading.Thread(
+                target=entry['context'].copy().run,
+                args=(entry['on_ready'], live, time_to_live),
+                name=f"pages-ready-{project_id}",
+                daemon=True
+            ).start()
+            return
+
+        # Poll quickly while GitHub is building, otherwise back off
+        if state == 'building':
+            entry['delay'] = self.min_delay
+        else:
+            entry['delay'] = min(entry['delay'] * 2, self.max_delay)
+        entry['next_poll'] = now + entry['delay']
+
+pages_watcher = PagesWatcher(PAGES_READY_TIMEOUT, PAGES_POLL_MIN_DELAY, PAGES_POLL_MAX_DELAY)
+
+@traced('check_pages_deployment')
+def check_pages_deployment(deployment):
+    """Return 'live', 'building' or 'pending' for a GitHub Pages deployment"""
+    import requests
+
+    builds_url = f"https://api.github.com/repos/{deployment['owner']}/{deployment['repo_name']}/pages/builds/latest"
+    try:
+        response = http_request('GET', builds_url, headers=github_api_headers(), timeout=10)
+        if response.status_code != 200:
+            return 'pending'
+
+        build = response.json()
+        if build.get('commit') != deployment['commit_sha']:
+            return 'pending'
+        if build.get('status') != 'built':
+            return 'building' if build.get('status') == 'building' else 'pending'
+
+        # The build is done; make sure the site itself is being served
+        site = http_request('GET', deployment['pages_url'], timeout=10)
+        return 'live' if site.status_code == 200 else 'building'
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Pages status check failed for {deployment['repo_name']}: {str(e)}")
+        return 'pending'
+
+@traced('run_checks')
 def run_checks(pages_url, checks):
     """Run validation checks (simulated for now)"""
     results = {
@@ -312,29 +2196,35 @@ def run_checks(pages_url, checks):
 
     return results
 
+@traced('notify_evaluation_service')
 def notify_evaluation_service(evaluation_url, payload):
     """Notify the evaluation service with retry logic"""
+    import requests
+
     max_retries = 5
     delay = 1  # Initial delay in seconds
 
     for attempt in range(max_retries):
         try:
-            print(f"Notifying evaluation URL: {evaluation_url} (Attempt {attempt + 1})")
-            response = requests.post(evaluation_url, json=payload, timeout=10)
+            logger.info(f"Notifying evaluation URL: {evaluation_url} (Attempt {attempt + 1})")
+            current_span().set_attribute('retry_count', attempt)
+            response = http_request('POST', evaluation_url, retry_count=attempt, json=payload, timeout=10)
             response.raise_for_status()  # Raise an exception for bad status codes
-            print("Successfully notified evaluation service.")
+            logger.info("Successfully notified evaluation service.")
             return
         except requests.exceptions.RequestException as e:
-            print(f"Failed to notify evaluation URL: {str(e)}")
+            logger.warning(f"Failed to notify evaluation URL: {str(e)}")
             if attempt < max_retries - 1:
-                print(f"Retrying in {delay} seconds...")
+                logger.info(f"Retrying in {delay} seconds...")
                 time.sleep(delay)
                 delay *= 2  # Exponential backoff
             else:
-                print("Max retries reached. Giving up.")
+                logger.error("Max retries reached. Giving up.")
 
+@traced('process_build_request')
 def process_build_request(data):
     """This function runs in a background thread to handle the build process."""
+    profile = None
     try:
         # Extract required fields
         email = data.get('email')
@@ -343,91 +2233,311 @@ def process_build_request(data):
         checks = data.get('checks', [])
         round_num = data.get('round', 1)
         nonce = data.get('nonce', f'nonce-{int(time.time())}')
-        evaluation_url = data.get('evaluation_url')
         attachments = data.get('attachments', [])
 
         # Generate unique project ID
         project_id = hashlib.md5(f"{email}{nonce}{task}".encode()).hexdigest()[:12]
+        set_log_context(project_id, 'start')
+        current_span().set_attribute('project_id', project_id)
+        current_span().set_attribute('round', round_num)
+        profile = build_profiler.maybe_start(project_id)
+
+        # Pick up checkpoints left by an interrupted attempt
+        job = job_store.start(project_id)
+        checkpoint = job['checkpoint'] if job else {}
 
         # Check if this is a revision (Round 2)
         existing_project = projects_db.get(project_id)
+        if existing_project:
+            existing_project['status'] = 'processing'
+            existing_project['message'] = 'Build process started.'
+            projects_db.touch(project_id)
         existing_code = None
         revision_request = None
 
-        if round_num == 2 and existing_project:
-            existing_code = existing_project.get('code', {}).get('html', '')
+        if round_num == 2:
+            existing_code = (
+                load_project_code(project_id).get('html')
+                or load_code_refs(checkpoint.get('previous_code_refs')).get('html')
+            )
             revision_request = brief
 
-        # Generate application code using LLM
-        print(f"Generating application for: {task}")
-        code_data = generate_app_with_llm(
-            brief=brief,
-            task=task,
-            checks=checks,
-            attachments=attachments,
-            existing_code=existing_code,
-            revision_request=revision_request
-        )
-
-        # Create repository name (sanitize)
-        repo_name_base = task.lower().replace(' ', '-').replace('_', '-')
-        repo_name_base = ''.join(c for c in repo_name_base if c.isalnum() or c == '-')
-        repo_name = f"{repo_name_base}-{project_id}"
-
-        # Deploy to GitHub Pages
-        print(f"Deploying to GitHub: {repo_name}")
-        deployment = create_github_repo(repo_name, code_data, email, attachments)
+        submission_text = SimilarityIndex.submission_text(task, brief, checks)
+        match_scope = similarity_scope(email, attachments)
+        reused_from = checkpoint.get('reused_from')
 
-        # Run checks
-        print(f"Running checks on: {deployment['pages_url']}")
-        check_results = run_checks(deployment['pages_url'], checks)
+        code_data = load_code_refs(checkpoint.get('code_refs'))
+        if code_data:
+            logger.info("Resuming with generated code from checkpoint")
+            code_refs = checkpoint['code_refs']
+        else:
+            # Start from a near-identical earlier build instead of generating from scratch
+            if not existing_code and SIMILARITY_REUSE:
+                match = similarity_index.query(submission_text, SIMILARITY_THRESHOLD, exclude=project_id, scope=match_scope)
+                if match:
+                    match_id, similarity, match_refs = match
+                    # Reuse is only an optimisation; fall back to a fresh build if the match is unusable
+                    try:
+                        existing_code = blob_store.get(match_refs['html']) if 'html' in match_refs else None
+                    except Exception as e:
+                        logger.warning(f"Could not reuse {match_id}, generating from scratch: {str(e)}")
+                        if isinstance(e, FileNotFoundError):
+                            similarity_index.remove(match_id)
+                    if existing_code:
+                        reused_from = {'project_id': match_id, 'similarity': round(similarity, 3)}
+                        revision_request = f"Adapt this application to a new brief.\nTASK: {task}\nBRIEF: {brief}"
+                        logger.info(f"Reusing {match_id} as a starting point (similarity {similarity:.2f})")
+
+            # Generate application code using LLM
+            set_log_stage('generate')
+            logger.info(f"Generating application for: {task}")
+            code_data = generate_app_with_llm(
+                brief=brief,
+                task=task,
+                checks=checks,
+                attachments=attachments,
+                existing_code=existing_code,
+                revision_request=revision_request,
+                tenant=email
+            )
+            code_refs = store_project_code(project_id, code_data)
+            job_store.checkpoint(project_id, 'generated', code_refs=code_refs, reused_from=reused_from)
+            similarity_index.add(project_id, submission_text, code_refs, match_scope)
 
-        # Store project data
+        if 'deployment' in checkpoint:
+            logger.info("Resuming with deployment from checkpoint")
+            deployment = checkpoint['deployment']
+        else:
+            # Create repository name (sanitize)
+            repo_name_base = task.lower().replace(' ', '-').replace('_', '-')
+            repo_name_base = ''.join(c for c in repo_name_base if c.isalnum() or c == '-')
+            repo_name = f"{repo_name_base}-{project_id}"
+
+            # Deploy to GitHub Pages
+            set_log_stage('deploy')
+            logger.info(f"Deploying to GitHub: {repo_name}")
+            deployment = create_github_repo(repo_name, code_data, email, attachments)
+            job_store.checkpoint(project_id, 'deployed', deployment=deployment)
+            # The repository has the attachments now; a resume never needs their data URIs
+            job_store.drop_attachments(project_id)
+
+        # Store project data (artifacts go to the blob store)
         projects_db[project_id] = {
             'email': email,
             'task': task,
-            'brief': brief,
-            'code': code_data,
+            'brief_ref': blob_store.put(brief),
+            'code_refs': code_refs,
             'deployment': deployment,
-            'checks': check_results,
             'round': round_num,
-            'status': 'completed',
+            'reused_from': reused_from,
+            'status': 'deploying',
+            'message': f"Waiting for GitHub Pages to serve commit {(deployment['commit_sha'] or '')[:7]}.",
+            'created_at': datetime.now().isoformat()
+        }
+
+        if 'pages_live' in checkpoint:
+            complete_build(project_id, data, checkpoint['pages_live'], checkpoint['time_to_live'])
+            return
+
+        # Hold back completion and notification until the site is live
+        pages_watcher.watch(
+            project_id,
+            deployment,
+            lambda live, time_to_live: complete_build(project_id, data, live, time_to_live)
+        )
+
+    except Exception as e:
+        logger.exception(f"Error in background thread: {str(e)}")
+        project_id = hashlib.md5(f"{data.get('email')}{data.get('nonce')}{data.get('task')}".encode()).hexdigest()[:12]
+        job_store.finish(project_id, 'failed', str(e))
+        projects_db[project_id] = {
+            'status': 'failed',
+            'message': str(e),
             'created_at': datetime.now().isoformat()
         }
+    finally:
+        if profile:
+            build_profiler.finish(profile)
+
+@traced('complete_build')
+def complete_build(project_id, data, pages_live, time_to_live):
+    """Run checks and notify the evaluation service once GitHub Pages is ready"""
+    set_log_context(project_id, 'pages')
+    current_span().set_attribute('pages_live', pages_live)
+    current_span().set_attribute('time_to_live', time_to_live)
+    try:
+        project = projects_db[project_id]
+        deployment = project['deployment']
+        checks = data.get('checks', [])
+        evaluation_url = data.get('evaluation_url')
+
+        job = job_store.load(project_id)
+        checkpoint = job['checkpoint'] if job else {}
+        if 'pages_live' not in checkpoint:
+            job_store.checkpoint(project_id, 'pages_live', pages_live=pages_live, time_to_live=time_to_live)
+
+        if not pages_live:
+            logger.warning(f"GitHub Pages not live after {time_to_live}s; continuing anyway")
+
+        # Run checks
+        if 'checks' in checkpoint:
+            check_results = checkpoint['checks']
+        else:
+            set_log_stage('checks')
+            logger.info(f"Running checks on: {deployment['pages_url']}")
+            check_results = run_checks(deployment['pages_url'], checks)
+            job_store.checkpoint(project_id, 'checked', checks=check_results)
+
+        project.update({
+            'checks': check_results,
+            'pages_live': pages_live,
+            'time_to_live': time_to_live,
+            'status': 'completed',
+            'message': None
+        })
+        projects_db.touch(project_id)
 
         # Notify evaluation URL if provided
-        if evaluation_url:
+        if evaluation_url and not checkpoint.get('notified'):
             notification_payload = {
                 'project_id': project_id,
-                'email': email,
+                'email': project['email'],
                 'repo_url': deployment['repo_url'],
                 'pages_url': deployment['pages_url'],
                 'commit_sha': deployment['commit_sha'],
-                'round': round_num,
-                'nonce': nonce,
+                'round': project['round'],
+                'nonce': data.get('nonce'),
                 'checks': check_results
             }
+            set_log_stage('notify')
             notify_evaluation_service(evaluation_url, notification_payload)
+            job_store.checkpoint(project_id, 'notified', notified=True)
+
+        job_store.finish(project_id, 'done')
 
     except Exception as e:
-        print(f"Error in background thread: {str(e)}")
-        project_id = hashlib.md5(f"{data.get('email')}{data.get('nonce')}{data.get('task')}".encode()).hexdigest()[:12]
+        logger.exception(f"Error completing build: {str(e)}")
+        job_store.finish(project_id, 'failed', str(e))
         projects_db[project_id] = {
             'status': 'failed',
             'message': str(e),
             'created_at': datetime.now().isoformat()
         }
 
+@app.before_request
+def start_background_services():
+    """Make sure this worker is sweeping for interrupted jobs"""
+    ensure_recovery_sweeper()
+
+# HTTP caching and compression
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+HOME_CACHE_SECONDS = int(os.environ.get('HOME_CACHE_SECONDS', '3600'))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript'}
+
+_etag_epoch = (None, None)
+
+def etag_epoch():
+    """Distinguishes ETags issued by different worker processes.
+
+    Derived per pid rather than at import, so workers forked from a preloaded
+    app do not share one.
+    """
+    global _etag_epoch
+    pid, epoch = _etag_epoch
+    if pid != os.getpid():
+        epoch = hashlib.sha256(f"{worker_id()}-{time.time()}".encode()).hexdigest()[:8]
+        _etag_epoch = (os.getpid(), epoch)
+    return epoch
+
+_home_page = None
+_home_page_lock = threading.Lock()
+
+def preferred_encoding():
+    """Pick the best response encoding the client accepts"""
+    accepted = request.accept_encodings
+    if brotli and accepted.quality('br') > 0:
+        return 'br'
+    if accepted.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+def get_home_page():
+    """Render the home page once per process, along with its compressed variants"""
+    global _home_page
+    if _home_page is None:
+        with _home_page_lock:
+            if _home_page is None:
+                body = render_template('index.html').encode('utf-8')
+                variants = {None: body, 'gzip': compress_body(body, 'gzip')}
+                if brotli:
+                    variants['br'] = compress_body(body, 'br')
+                _home_page = {
+                    'etag': hashlib.sha256(body).hexdigest()[:16],
+                    'variants': variants
+                }
+    return _home_page
+
+@app.after_request
+def compress_response(response):
+    """Compress large text responses when the client supports it"""
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or 'Content-Encoding' in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    encoding = preferred_encoding()
+    if len(body) < COMPRESS_MIN_SIZE or not encoding:
+        return response
+
+    response.set_data(compress_body(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak=weak)
+    return response
+
 @app.route('/')
 def home():
     """Home page"""
-    return render_template('index.html')
+    page = get_home_page()
+    encoding = preferred_encoding()
+    etag = page['etag'] if not encoding else f"{page['etag']}-{encoding}"
+
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(page['variants'][encoding])
+        response.mimetype = 'text/html'
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = f'public, max-age={HOME_CACHE_SECONDS}'
+    return response
 
 @app.route('/api/build', methods=['POST'])
+@traced('build_application')
 def build_application():
     """Main endpoint to build and deploy application"""
     try:
-        data = request.get_json()
+        # Body size is capped by MAX_CONTENT_LENGTH while the body is read
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({
+                'status': 'error',
+                'message': 'Request body must be a JSON object'
+            }), 400
 
         # Extract required fields for validation
         email = data.get('email')
@@ -443,6 +2553,14 @@ def build_application():
                 'message': 'Missing required fields: email, secret, task, brief, and nonce are required'
             }), 400
 
+        # Validate field types, sizes and attachments before any work is scheduled
+        validation_error = validate_build_request(data)
+        if validation_error:
+            return jsonify({
+                'status': 'error',
+                'message': validation_error
+            }), 400
+
         # Verify secret
         if not verify_secret(secret):
             return jsonify({
@@ -460,17 +2578,59 @@ def build_application():
         # Generate unique project ID
         project_id = hashlib.md5(f"{email}{nonce}{task}".encode()).hexdigest()[:12]
 
-        # Start background thread for processing
-        thread = threading.Thread(target=process_build_request, args=(data,))
-        thread.daemon = True
-        thread.start()
+        # Store initial project status, keeping earlier artifacts for round 2 lookups
+        previous = projects_db.get(project_id) or {}
+        previous_job = job_store.load(project_id)
+        previous_code_refs = previous.get('code_refs') or (previous_job or {}).get('checkpoint', {}).get('code_refs')
+
+        # A round 2 prompt also carries the existing code, so count it against the limit
+        if data.get('round') == 2 and previous_code_refs:
+            existing_code = load_project_code(project_id).get('html') or load_code_refs(previous_code_refs).get('html')
+            size_error = prompt_size_error(data, existing_code)
+            if size_error:
+                return jsonify({
+                    'status': 'error',
+                    'message': size_error
+                }), 400
+
+        # Persist the job (without the secret) so it can be resumed if this worker dies.
+        # Replacing a job that is still running would hand its checkpoints to this one.
+        job_data = {key: value for key, value in data.items() if key != 'secret'}
+        if not job_store.create(project_id, email, job_data, {'previous_code_refs': previous_code_refs} if previous_code_refs else None):
+            return jsonify({
+                'status': 'error',
+                'message': 'A build for this project is still in progress. Wait for it to finish before submitting again.'
+            }), 409
 
-        # Store initial project status
         projects_db[project_id] = {
-            'status': 'processing',
-            'message': 'Build process started.',
+            'status': 'queued',
+            'message': 'Build queued.',
             'created_at': datetime.now().isoformat()
         }
+        if previous_code_refs:
+            projects_db[project_id]['code_refs'] = previous_code_refs
+            projects_db.touch(project_id)
+
+        # Queue the build with the fair-share scheduler
+        try:
+            jobs_ahead = build_scheduler.submit(email, project_id, process_build_request, job_data)
+        except QuotaExceeded as e:
+            if previous:
+                projects_db[project_id] = previous
+            else:
+                projects_db.pop(project_id, None)
+            if previous_job:
+                job_store.save(previous_job)
+            else:
+                job_store.delete(project_id)
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 429
+
+        if jobs_ahead and projects_db[project_id].get('status') == 'queued':
+            projects_db[project_id]['message'] = f"Build queued behind {jobs_ahead} earlier build(s) from {email}."
+            projects_db.touch(project_id)
 
         return jsonify({
             'status': 'success',
@@ -478,16 +2638,37 @@ def build_application():
             'project_id': project_id
         }), 200
 
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error: {str(e)}")
+        logger.exception(f"Error: {str(e)}")
         return jsonify({
             'status': 'error',
             'message': str(e)
         }), 500
 
+@app.errorhandler(413)
+def request_too_large(e):
+    """Reject oversized bodies with a JSON error"""
+    return jsonify({
+        'status': 'error',
+        'message': f'Request body exceeds {MAX_REQUEST_BYTES} bytes'
+    }), 413
+
 @app.route('/api/status/<project_id>', methods=['GET'])
 def get_project_status(project_id):
     """Get project status"""
+    # Cheap revalidation: the ETag only changes when the project record does
+    etag = f"{etag_epoch()}-{project_id}-{projects_db.version(project_id)}"
+    # Compressed bodies carry an encoding suffix on their ETag (see compress_response)
+    matched = next((tag for tag in (etag, f"{etag}-gzip", f"{etag}-br") if request.if_none_match.contains(tag)), None)
+    if matched:
+        response = make_response('', 304)
+        response.set_etag(matched)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
     project = projects_db.get(project_id)
 
     if not project:
@@ -502,10 +2683,13 @@ def get_project_status(project_id):
         deployment = project.get('deployment', {})
         response_data['repo_url'] = deployment.get('repo_url')
         response_data['pages_url'] = deployment.get('pages_url')
-    elif project.get('status') == 'failed':
+    else:
         response_data['message'] = project.get('message')
 
-    return jsonify(response_data), 200
+    response = jsonify(response_data)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/api/projects', methods=['GET'])
 def list_projects():
@@ -516,6 +2700,69 @@ def list_projects():
         'count': len(projects_db)
     }), 200
 
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """View or change build profiling settings (admin only)"""
+    if not verify_admin(request.headers.get('X-Admin-Secret')):
+        return jsonify({
+            'status': 'error',
+            'message': 'Admin access denied'
+        }), 403
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        changes = {}
+        if 'enabled' in data:
+            changes['enabled'] = bool(data['enabled'])
+        if 'allocations' in data:
+            changes['allocations'] = bool(data['allocations'])
+        try:
+            if 'sample_percent' in data:
+                changes['sample_percent'] = min(100.0, max(0.0, float(data['sample_percent'])))
+            if 'interval_ms' in data:
+                changes['interval_ms'] = min(1000, max(1, int(data['interval_ms'])))
+        except (TypeError, ValueError):
+            return jsonify({
+                'status': 'error',
+                'message': 'sample_percent and interval_ms must be numbers'
+            }), 400
+        build_profiler.update_settings(changes)
+
+    return jsonify({
+        'status': 'success',
+        'settings': build_profiler.settings(),
+        'profiles': build_profiler.list_profiles()
+    }), 200
+
+@app.route('/api/admin/profiling/flamegraph', methods=['GET'])
+def download_flame_graph():
+    """Download an aggregated flame graph of all stored build profiles (admin only)"""
+    if not verify_admin(request.headers.get('X-Admin-Secret')):
+        return jsonify({
+            'status': 'error',
+            'message': 'Admin access denied'
+        }), 403
+
+    kind = request.args.get('kind', 'wall')
+    output_format = request.args.get('format', 'svg')
+    if kind not in ('wall', 'alloc') or output_format not in ('svg', 'collapsed'):
+        return jsonify({
+            'status': 'error',
+            'message': "kind must be 'wall' or 'alloc' and format must be 'svg' or 'collapsed'"
+        }), 400
+
+    stacks = build_profiler.aggregate(kind)
+    if output_format == 'collapsed':
+        body = ''.join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+        response = make_response(body)
+        response.mimetype = 'text/plain'
+    else:
+        title = 'Build wall-clock samples' if kind == 'wall' else 'Build allocations (bytes)'
+        response = make_response(render_flame_graph(stacks, title))
+        response.mimetype = 'image/svg+xml'
+    response.headers['Content-Disposition'] = f'attachment; filename=flamegraph-{kind}.{output_format}'
+    return response
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -529,7 +2776,43 @@ def health():
         }
     })
 
+def profile_startup(limit=15):
+    """Import the app in a fresh interpreter and report import time per top-level module"""
+    import subprocess
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True
+    )
+
+    # Lines look like: "import time:   self [us] |  cumulative | imported package",
+    # with nesting shown by two extra spaces of indentation per level
+    total_ms = 0.0
+    per_module = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        ms = int(cumulative) / 1000
+        if depth == 0:
+            total_ms += ms
+        elif depth == 1:
+            per_module[name.strip()] = per_module.get(name.strip(), 0) + ms
+
+    print(f"{'module':<40} {'ms':>10}")
+    for name, ms in sorted(per_module.items(), key=lambda item: item[1], reverse=True)[:limit]:
+        print(f"{name:<40} {ms:>10.1f}")
+    status = '✓' if total_ms <= STARTUP_TARGET_MS else '✗'
+    print(f"{status} Total import time: {total_ms:.1f} ms (target {STARTUP_TARGET_MS} ms)")
+    return total_ms
+
 if __name__ == '__main__':
+    if '--profile-startup' in sys.argv:
+        sys.exit(0 if profile_startup() <= STARTUP_TARGET_MS else 1)
+
     port = int(os.environ.get('PORT', 5000))
     print(f"Starting LLM Application Builder on port {port}")
     print(f"AIPipe API: {'✓ Configured' if AIPIPE_API_KEY else '✗ Not configured'}")
@@ -0,0 +1,21 @@
+"""Gunicorn settings, loaded automatically from the working directory.
+
+Set GUNICORN_PRELOAD=1 to import the app once in the master process and
+fork workers from it, so new workers are ready almost immediately.
+"""
+import os
+import sys
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '0') == '1'
+
+def post_fork(server, worker):
+    """Make sure a preloaded app does not share connection pools with its parent"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.reset_clients_after_fork()
+
+def post_worker_init(worker):
+    """Start sweeping for interrupted builds as soon as a worker is ready"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.ensure_recovery_sweeper()
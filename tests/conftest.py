@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# Keep the job database and blobs out of the working tree; set before app is imported
+os.environ.setdefault('DATA_DIR', tempfile.mkdtemp(prefix='llm-app-builder-tests-'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def client():
+    app_module.app.config['TESTING'] = True
+    with app_module.app.test_client() as client:
+        yield client
@@ -0,0 +1,55 @@
+import pytest
+
+import app as app_module
+from app import strip_code_fence
+
+
+@pytest.mark.parametrize('content, expected', [
+    ('```css\nbody { margin: 0; }\n```', 'body { margin: 0; }'),
+    ('```javascript\nlet count = 0;\n```\nThis script keeps a counter.', 'let count = 0;'),
+    ('```css\nbody { margin: 0; }', 'body { margin: 0; }'),
+    ('```javascript\nlet count = 0;\nfunction inc', 'let count = 0;\nfunction inc'),
+    ('```markdown\n# App\n```bash\nnpm install\n```\nEnjoy\n```', '# App\n```bash\nnpm install\n```\nEnjoy'),
+    ('# App\n\n```bash\nnpm install\n```\n\nEnjoy', '# App\n\n```bash\nnpm install\n```\n\nEnjoy'),
+    ('  <main id="app"></main>\n', '<main id="app"></main>'),
+    ('```', ''),
+])
+def test_strip_code_fence(content, expected):
+    assert strip_code_fence(content) == expected
+
+
+def fake_llm(css_replies):
+    """call_llm stand-in: a fixed plan, one-line parts and scripted CSS replies"""
+    calls = []
+
+    def call_llm(prompt, max_tokens, tenant=None, partial=None):
+        if max_tokens == app_module.CHUNK_PLAN_MAX_TOKENS:
+            return '{"title": "Counter", "sections": []}', 'stop'
+        if 'CSS stylesheet' in prompt:
+            calls.append(partial)
+            return css_replies[len(calls) - 1]
+        return '```\n<main></main>\n```', 'stop'
+
+    return call_llm, calls
+
+
+def test_truncated_part_is_continued(monkeypatch):
+    call_llm, calls = fake_llm([
+        ('```css\nbody {', 'length'),
+        ('```css\n margin: 0; }\n```', 'stop')
+    ])
+    monkeypatch.setattr(app_module, 'call_llm', call_llm)
+
+    code = app_module.generate_app_chunked('brief', 'task', [], '')
+
+    assert calls == [None, '```css\nbody {']
+    assert code['css'] == 'body { margin: 0; }'
+
+
+def test_part_still_truncated_after_continuations_fails(monkeypatch):
+    call_llm, calls = fake_llm([('```css\nbody {', 'length')] * (app_module.CHUNK_MAX_CONTINUATIONS + 1))
+    monkeypatch.setattr(app_module, 'call_llm', call_llm)
+
+    with pytest.raises(Exception, match="'css' was still incomplete"):
+        app_module.generate_app_chunked('brief', 'task', [], '')
+    assert len(calls) == app_module.CHUNK_MAX_CONTINUATIONS + 1
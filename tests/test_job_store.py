@@ -0,0 +1,199 @@
+import hashlib
+import time
+from contextlib import closing
+
+import pytest
+
+import app as app_module
+from app import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'), lease_seconds=60)
+
+
+def test_claim_expired_takes_over_only_lapsed_leases(store):
+    store.create('live', 'a@example.com', {'task': 'live'})
+    store.create('lapsed', 'a@example.com', {'task': 'lapsed'})
+    store.save({**store.load('lapsed'), 'lease_owner': 'dead-host:1', 'lease_expires': time.time() - 1})
+
+    claimed = store.claim_expired()
+
+    assert [job['project_id'] for job in claimed] == ['lapsed']
+    assert claimed[0]['request'] == {'task': 'lapsed'}
+    assert claimed[0]['lease_owner'] == app_module.worker_id()
+    assert claimed[0]['lease_expires'] > time.time()
+    assert store.claim_expired() == []
+
+
+def test_finished_jobs_are_never_claimed(store):
+    store.create('done', 'a@example.com', {})
+    store.finish('done', 'done')
+
+    assert store.claim_expired() == []
+
+
+def test_renew_leases_extends_held_jobs(store):
+    store.create('held', 'a@example.com', {})
+    store.save({**store.load('held'), 'lease_expires': time.time() + 1})
+
+    store.renew_leases()
+
+    assert store.load('held')['lease_expires'] > time.time() + 30
+
+
+def test_released_job_is_not_renewed_and_can_be_claimed(store):
+    store.create('released', 'a@example.com', {})
+    store.release('released', count_attempt=True)
+
+    store.renew_leases()
+    job = store.load('released')
+    assert job['lease_expires'] == 0
+    assert job['attempts'] == 1
+    assert [job['project_id'] for job in store.claim_expired()] == ['released']
+
+
+def test_checkpoints_merge_and_survive_restarts(store):
+    store.create('job', 'a@example.com', {'task': 't'})
+    store.checkpoint('job', 'generated', code_refs={'html': 'abc'})
+    store.checkpoint('job', 'deployed', deployment={'repo_url': 'https://github.com/o/r'})
+
+    job = JobStore(store.path, store.lease_seconds).start('job')
+
+    assert job['stage'] == 'deployed'
+    assert job['attempts'] == 1
+    assert job['checkpoint'] == {
+        'code_refs': {'html': 'abc'},
+        'deployment': {'repo_url': 'https://github.com/o/r'}
+    }
+
+
+def test_attachment_data_is_dropped_but_names_kept(store):
+    store.create('job', 'a@example.com', {'attachments': [{'name': 'a.png', 'url': 'data:image/png;base64,AAAA'}]})
+
+    store.drop_attachments('job')
+
+    assert store.load('job')['request'] == {'attachments': [{'name': 'a.png'}]}
+
+
+def test_purge_finished_keeps_running_and_recent_jobs(store):
+    store.create('running', 'a@example.com', {})
+    store.create('old', 'a@example.com', {})
+    store.create('recent', 'a@example.com', {})
+    store.finish('old', 'failed', 'boom')
+    store.finish('recent', 'done')
+    with closing(store._connect()) as conn:
+        conn.execute("UPDATE build_jobs SET updated_at = ? WHERE project_id = 'old'", (time.time() - 7200,))
+
+    assert store.purge_finished(3600) == 1
+    assert store.load('old') is None
+    assert store.load('running') is not None
+    assert store.load('recent') is not None
+
+
+def build_request(nonce):
+    return {
+        'email': 'resume@example.com',
+        'task': 'resume-test',
+        'brief': 'A page that says hello.',
+        'nonce': nonce,
+        'round': 1,
+        'checks': []
+    }
+
+
+def request_project_id(data):
+    return hashlib.md5(f"{data['email']}{data['nonce']}{data['task']}".encode()).hexdigest()[:12]
+
+
+def test_resume_skips_generation_after_generated_checkpoint(monkeypatch):
+    data = build_request('resume-generated')
+    project_id = request_project_id(data)
+    code_refs = app_module.store_project_code(project_id, {'html': '<p>hello</p>', 'readme': '# hello'})
+    app_module.job_store.create(project_id, data['email'], data)
+    app_module.job_store.checkpoint(project_id, 'generated', code_refs=code_refs, reused_from=None)
+
+    def fail_generation(**kwargs):
+        raise AssertionError('generation should have been skipped')
+
+    deployed = []
+    watched = []
+    monkeypatch.setattr(app_module, 'generate_app_with_llm', fail_generation)
+    monkeypatch.setattr(app_module, 'create_github_repo', lambda repo_name, code_data, email, attachments: deployed.append(code_data) or {'repo_url': 'r', 'pages_url': 'p', 'commit_sha': 'abc1234'})
+    monkeypatch.setattr(app_module.pages_watcher, 'watch', lambda project_id, deployment, on_ready: watched.append(project_id))
+
+    app_module.process_build_request(data)
+
+    job = app_module.job_store.load(project_id)
+    assert deployed == [{'html': '<p>hello</p>', 'readme': '# hello'}]
+    assert watched == [project_id]
+    assert job['stage'] == 'deployed'
+    assert job['status'] == 'running'
+    assert job['checkpoint']['deployment']['commit_sha'] == 'abc1234'
+
+
+def test_resume_after_deploy_does_not_redeploy(monkeypatch):
+    data = build_request('resume-deployed')
+    project_id = request_project_id(data)
+    code_refs = app_module.store_project_code(project_id, {'html': '<p>hello</p>'})
+    deployment = {'repo_url': 'r', 'pages_url': 'p', 'commit_sha': 'def5678'}
+    app_module.job_store.create(project_id, data['email'], data)
+    app_module.job_store.checkpoint(project_id, 'generated', code_refs=code_refs, reused_from=None)
+    app_module.job_store.checkpoint(project_id, 'deployed', deployment=deployment)
+
+    def fail_deploy(*args):
+        raise AssertionError('deployment should have been skipped')
+
+    watched = []
+    monkeypatch.setattr(app_module, 'create_github_repo', fail_deploy)
+    monkeypatch.setattr(app_module.pages_watcher, 'watch', lambda project_id, deployment, on_ready: watched.append(deployment))
+
+    app_module.process_build_request(data)
+
+    assert watched == [deployment]
+    assert app_module.projects_db[project_id]['status'] == 'deploying'
+
+
+
+def test_maintenance_keeps_blobs_referenced_by_jobs(monkeypatch, tmp_path):
+    blobs = app_module.BlobStore(str(tmp_path / 'blobs'))
+    monkeypatch.setattr(app_module, 'blob_store', blobs)
+    referenced = blobs.put('<p>round 1</p>')
+    orphan = blobs.put('<p>orphan</p>')
+    app_module.job_store.create('gc-job', 'a@example.com', {})
+    app_module.job_store.checkpoint('gc-job', 'generated', code_refs={'html': referenced})
+    monkeypatch.setattr(app_module, 'BLOB_RETENTION_DAYS', -1)
+
+    app_module.run_maintenance()
+
+    assert app_module.load_code_refs({'html': referenced}) == {'html': '<p>round 1</p>'}
+    assert app_module.load_code_refs({'html': referenced, 'readme': orphan}) == {}
+
+
+def test_create_does_not_replace_a_running_job(store):
+    assert store.create('job', 'a@example.com', {'round': 1})
+    store.checkpoint('job', 'deployed', deployment={'repo_url': 'r'})
+
+    assert not store.create('job', 'a@example.com', {'round': 2})
+    assert store.load('job')['request'] == {'round': 1}
+
+    store.finish('job', 'done')
+    assert store.create('job', 'a@example.com', {'round': 2})
+    assert store.load('job')['checkpoint'] == {}
+
+
+def test_resubmission_while_running_is_rejected(client, monkeypatch):
+    monkeypatch.setattr(app_module, 'verify_secret', lambda secret: True)
+    monkeypatch.setattr(app_module, 'AIPIPE_API_KEY', 'key')
+    monkeypatch.setattr(app_module, 'GITHUB_TOKEN', 'token')
+    submitted = []
+    monkeypatch.setattr(app_module.build_scheduler, 'submit', lambda *args, **kwargs: submitted.append(args) or 0)
+    body = {**build_request('resubmit-running'), 'secret': 's'}
+
+    assert client.post('/api/build', json=body).status_code == 200
+    response = client.post('/api/build', json={**body, 'round': 2})
+
+    assert response.status_code == 409
+    assert len(submitted) == 1
+    assert app_module.job_store.load(request_project_id(body))['request']['round'] == 1
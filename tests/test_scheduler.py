@@ -0,0 +1,159 @@
+import threading
+import time
+
+import pytest
+
+from app import FairScheduler, JobStore, QuotaExceeded
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'), lease_seconds=60)
+
+
+def make_scheduler(store, **limits):
+    settings = {
+        'worker_count': 1,
+        'max_concurrent': 1,
+        'max_queued': 10,
+        'daily_requests': 100,
+        'daily_tokens': 1000000,
+        'poll_interval': 0.05
+    }
+    settings.update(limits)
+    return FairScheduler(store, **settings)
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+def test_tenants_are_served_round_robin(store):
+    scheduler = make_scheduler(store)
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def job(name):
+        order.append(name)
+        if name == 'a1':
+            started.set()
+            release.wait(5)
+
+    # a1 holds the only worker while the rest of the queue builds up
+    scheduler.submit('a', 'a1', job, 'a1')
+    assert started.wait(5)
+    for name in ('a2', 'a3', 'a4'):
+        scheduler.submit('a', name, job, name)
+    for name in ('b1', 'b2'):
+        scheduler.submit('b', name, job, name)
+    release.set()
+
+    wait_for(lambda: len(order) == 6)
+    assert order == ['a1', 'a2', 'b1', 'a3', 'b2', 'a4']
+
+
+def test_weights_give_tenants_more_turns(store):
+    scheduler = make_scheduler(store, weights={'a': 2})
+    started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def job(name):
+        order.append(name)
+        if name == 'blocker':
+            started.set()
+            release.wait(5)
+
+    scheduler.submit('c', 'blocker', job, 'blocker')
+    assert started.wait(5)
+    for name in ('a1', 'a2', 'a3'):
+        scheduler.submit('a', name, job, name)
+    for name in ('b1', 'b2'):
+        scheduler.submit('b', name, job, name)
+    release.set()
+
+    wait_for(lambda: len(order) == 6)
+    assert order == ['blocker', 'a1', 'a2', 'b1', 'a3', 'b2']
+
+
+def test_daily_request_quota_is_shared_between_schedulers(store):
+    first = make_scheduler(store, daily_requests=2)
+    second = make_scheduler(store, daily_requests=2)
+    done = []
+
+    first.submit('a', 'a1', done.append, 'a1')
+    second.submit('a', 'a2', done.append, 'a2')
+    with pytest.raises(QuotaExceeded, match='Daily request quota'):
+        first.submit('a', 'a3', done.append, 'a3')
+
+    # Resumed jobs are not new requests
+    second.submit('a', 'a1', done.append, 'a1-resumed', count_request=False)
+    first.submit('b', 'b1', done.append, 'b1')
+    wait_for(lambda: len(done) == 4)
+
+
+def test_token_budget_rejects_new_and_resumed_jobs(store):
+    scheduler = make_scheduler(store, daily_tokens=1000)
+    scheduler.record_tokens('a', 1000)
+
+    with pytest.raises(QuotaExceeded, match='token budget'):
+        scheduler.submit('a', 'a1', lambda: None)
+    with pytest.raises(QuotaExceeded, match='token budget'):
+        scheduler.submit('a', 'a1', lambda: None, count_request=False)
+    scheduler.submit('b', 'b1', lambda: None)
+
+
+def test_queue_limit_counts_jobs_queued_by_other_workers(store):
+    scheduler = make_scheduler(store, max_queued=1)
+    store.create('elsewhere', 'a', {})
+    store.save({**store.load('elsewhere'), 'lease_owner': 'other-host:1'})
+
+    with pytest.raises(QuotaExceeded, match='Too many queued builds'):
+        scheduler.submit('a', 'a1', lambda: None)
+    scheduler.submit('b', 'b1', lambda: None)
+
+
+def test_concurrency_cap_counts_jobs_running_in_other_workers(store):
+    scheduler = make_scheduler(store, worker_count=2)
+    store.create('elsewhere', 'a', {})
+    store.save({**store.load('elsewhere'), 'lease_owner': 'other-host:1', 'executing': 1, 'stage': 'generated'})
+    done = []
+
+    scheduler.submit('a', 'a1', done.append, 'a1')
+    scheduler.submit('b', 'b1', done.append, 'b1')
+    wait_for(lambda: done == ['b1'])
+    time.sleep(0.2)
+    assert done == ['b1']
+
+    store.finish('elsewhere', 'done')
+    wait_for(lambda: done == ['b1', 'a1'])
+
+
+def test_submit_does_not_wait_for_workers_reading_the_store(store):
+    class SlowStore:
+        """Job store that is slow to answer build workers, as under SQLite lock contention"""
+
+        def __getattr__(self, name):
+            attribute = getattr(store, name)
+            if not callable(attribute) or not threading.current_thread().name.startswith('build-worker'):
+                return attribute
+
+            def slow(*args, **kwargs):
+                time.sleep(0.5)
+                return attribute(*args, **kwargs)
+            return slow
+
+    scheduler = make_scheduler(SlowStore(), worker_count=2)
+    done = []
+    scheduler.submit('a', 'a1', done.append, 'a1')
+    time.sleep(0.1)
+
+    started = time.monotonic()
+    scheduler.submit('b', 'b1', done.append, 'b1')
+    assert time.monotonic() - started < 0.3
+    wait_for(lambda: sorted(done) == ['a1', 'b1'])
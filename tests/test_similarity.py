@@ -0,0 +1,50 @@
+import app as app_module
+from app import SimilarityIndex, similarity_scope
+
+BRIEF = 'Build a todo list with add and delete buttons that keeps items in local storage.'
+
+
+def submission(brief=BRIEF):
+    return SimilarityIndex.submission_text('todo-app', brief, ['Page has a button'])
+
+
+def test_matches_are_scoped_to_submitter_and_attachment_names():
+    index = SimilarityIndex()
+    scope = similarity_scope('a@example.com', [{'name': 'logo.png'}])
+    index.add('earlier', submission(), {'html': 'digest'}, scope)
+
+    assert index.query(submission(), 0.8, scope=scope)[0] == 'earlier'
+    assert index.query(submission(), 0.8, scope=similarity_scope('b@example.com', [{'name': 'logo.png'}])) is None
+    assert index.query(submission(), 0.8, scope=similarity_scope('a@example.com', [])) is None
+    assert index.query(submission(), 0.8, exclude='earlier', scope=scope) is None
+
+
+def test_prune_drops_entries_failing_the_check():
+    index = SimilarityIndex()
+    index.add('kept', submission(), {'html': 'present'})
+    index.add('gone', submission(BRIEF + ' Also a dark mode.'), {'html': 'missing'})
+
+    assert index.prune(lambda code_refs: code_refs['html'] == 'present') == 1
+    assert index.query(submission(BRIEF + ' Also a dark mode.'), 0.5)[0] == 'kept'
+
+
+def test_build_generates_from_scratch_when_matched_blob_is_gone(monkeypatch):
+    data = {
+        'email': 'reuse@example.com',
+        'task': 'todo-app',
+        'brief': BRIEF,
+        'nonce': 'reuse-missing-blob',
+        'checks': ['Page has a button']
+    }
+    scope = similarity_scope(data['email'], [])
+    app_module.similarity_index.add('collected', submission(), {'html': '0' * 64}, scope)
+
+    generated = []
+    monkeypatch.setattr(app_module, 'generate_app_with_llm', lambda **kwargs: generated.append(kwargs['existing_code']) or {'html': '<p>new</p>'})
+    monkeypatch.setattr(app_module, 'create_github_repo', lambda *args: {'repo_url': 'r', 'pages_url': 'p', 'commit_sha': 'abc1234'})
+    monkeypatch.setattr(app_module.pages_watcher, 'watch', lambda *args: None)
+
+    app_module.process_build_request(data)
+
+    assert generated == [None]
+    assert app_module.similarity_index.query(submission(), 0.8, scope=scope)[0] != 'collected'
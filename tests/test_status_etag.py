@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import app as app_module
+
+
+def set_project(project_id, message):
+    app_module.projects_db[project_id] = {
+        'status': 'processing',
+        'message': message,
+        'created_at': datetime.now().isoformat()
+    }
+
+
+def test_small_status_revalidates_with_plain_etag(client):
+    set_project('etag-small', 'Generating code.')
+
+    response = client.get('/api/status/etag-small', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    etag = response.headers['ETag']
+
+    response = client.get('/api/status/etag-small', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_compressed_status_revalidates_with_suffixed_etag(client):
+    set_project('etag-large', 'x' * (app_module.COMPRESS_MIN_SIZE * 2))
+
+    response = client.get('/api/status/etag-large', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    etag = response.headers['ETag']
+    assert etag.endswith('-gzip"')
+
+    response = client.get('/api/status/etag-large', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_status_change_invalidates_etag(client):
+    set_project('etag-change', 'Generating code.')
+    etag = client.get('/api/status/etag-change').headers['ETag']
+
+    set_project('etag-change', 'Deploying to GitHub.')
+    response = client.get('/api/status/etag-change', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['message'] == 'Deploying to GitHub.'
+
+
+def test_forked_workers_issue_different_etags(client, monkeypatch):
+    set_project('etag-fork', 'Generating code.')
+    etag = client.get('/api/status/etag-fork').headers['ETag']
+
+    # A worker forked from a preloaded parent inherits the parent's epoch under another pid
+    monkeypatch.setattr(app_module, '_etag_epoch', (-1, app_module.etag_epoch()))
+    response = client.get('/api/status/etag-fork', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
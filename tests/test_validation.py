@@ -0,0 +1,66 @@
+import pytest
+
+import app as app_module
+from app import validate_build_request
+
+
+def valid_request(**overrides):
+    data = {
+        'email': 'student@example.com',
+        'secret': 's3cret',
+        'task': 'captcha-solver',
+        'brief': 'Create a page that shows an image and its solved text.',
+        'nonce': 'abc-123',
+        'round': 1,
+        'evaluation_url': 'https://example.com/notify',
+        'checks': ['Page has a title'],
+        'attachments': [{'name': 'sample.png', 'url': 'data:image/png;base64,iVBORw0KGgo='}]
+    }
+    data.update(overrides)
+    return data
+
+
+def test_valid_request_passes():
+    assert validate_build_request(valid_request()) is None
+
+
+def test_optional_fields_may_be_missing():
+    data = valid_request()
+    for field in ('round', 'evaluation_url', 'checks', 'attachments'):
+        del data[field]
+    assert validate_build_request(data) is None
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({'email': 'not-an-email'}, "'email' is not valid"),
+    ({'task': ['captcha']}, "'task' must be of type str"),
+    ({'round': True}, "'round' must be of type int"),
+    ({'round': 3}, "'round' must be one of 1, 2"),
+    ({'brief': 'x' * (app_module.MAX_BRIEF_CHARS + 1)}, "'brief' must be at most"),
+    ({'evaluation_url': 'ftp://example.com'}, "'evaluation_url' is not valid"),
+    ({'checks': ['ok', 3]}, "'checks[1]' must be of type str"),
+    ({'checks': ['x'] * (app_module.MAX_CHECKS + 1)}, "'checks' must have at most"),
+    ({'attachments': [{'name': '../etc/passwd', 'url': 'data:text/plain;base64,AAAA'}]}, "'attachments[0]' has an invalid file name"),
+    ({'attachments': [{'name': 'a.txt', 'url': 'https://example.com/a.txt'}]}, "'attachments[0]' must have a base64 data URI"),
+    ({'attachments': [{'name': 'a.txt', 'url': 'data:text/plain;base64,AAA'}]}, "'attachments[0]' does not contain valid base64"),
+])
+def test_invalid_fields_are_rejected(overrides, message):
+    assert message in validate_build_request(valid_request(**overrides))
+
+
+def test_empty_evaluation_url_is_allowed():
+    assert validate_build_request(valid_request(evaluation_url='')) is None
+
+
+def test_prompt_size_limit_binds_within_field_limits():
+    data = valid_request(
+        brief='x' * app_module.MAX_BRIEF_CHARS,
+        checks=['y' * 1000] * app_module.MAX_CHECKS
+    )
+    assert 'prompt tokens' in validate_build_request(data)
+
+
+def test_prompt_size_counts_existing_code():
+    data = valid_request()
+    assert app_module.prompt_size_error(data) is None
+    assert 'prompt tokens' in app_module.prompt_size_error(data, existing_code='z' * app_module.MAX_PROMPT_TOKENS * 4)